@@ -0,0 +1,142 @@
+import asyncio
+import os
+from collections import OrderedDict
+
+SUFFIX = ".opus"
+PART_SUFFIX = ".opus.part"
+
+
+class AudioCache:
+    def __init__(self, directory: str, max_bytes: int, max_track_seconds: float = 900,
+                 fill_concurrency: int = 2, bitrate: str = "128k"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_track_seconds = max_track_seconds
+        self.bitrate = bitrate
+        self.stats = {"hits": 0, "misses": 0, "fills": 0, "failed": 0, "evicted": 0}
+        self.on_fill = []
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._filling = {}
+        self.running = 0
+        self._sem = asyncio.Semaphore(fill_concurrency)
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, video_id: str) -> str:
+        return os.path.join(self.directory, video_id + SUFFIX)
+
+    def _load(self):
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(PART_SUFFIX):
+                # Left behind by a fill that was interrupted.
+                os.unlink(entry.path)
+            elif entry.name.endswith(SUFFIX):
+                st = entry.stat()
+                found.append((st.st_mtime, entry.name[:-len(SUFFIX)], st.st_size))
+        for _, video_id, size in sorted(found):
+            self._entries[video_id] = size
+            self._bytes += size
+        self._evict()
+
+    @property
+    def size(self) -> int:
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, video_id):
+        return video_id in self._entries
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def lookup(self, video_id: str):
+        if video_id not in self._entries:
+            self.stats["misses"] += 1
+            return None
+        path = self._path(video_id)
+        try:
+            # mtime doubles as the recency order when the index is rebuilt on startup.
+            os.utime(path)
+        except FileNotFoundError:
+            self._bytes -= self._entries.pop(video_id)
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(video_id)
+        self.stats["hits"] += 1
+        return path
+
+    def fill(self, video_id: str, stream_url: str, duration: float = 0) -> bool:
+        # True when a fill is running for the track, so its on_fill hooks will fire.
+        if not video_id or video_id in self._entries:
+            return False
+        if video_id in self._filling:
+            return True
+        if not duration or duration > self.max_track_seconds:
+            return False
+        task = asyncio.ensure_future(self._fill(video_id, stream_url))
+        self._filling[video_id] = task
+        task.add_done_callback(lambda _: self._filling.pop(video_id, None))
+        return True
+
+    async def _fill(self, video_id: str, stream_url: str):
+        part = os.path.join(self.directory, video_id + PART_SUFFIX)
+        async with self._sem:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    "ffmpeg", "-nostdin", "-loglevel", "error",
+                    "-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5",
+                    "-i", stream_url, "-vn", "-c:a", "libopus", "-b:a", self.bitrate, "-f", "opus", part,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+                self.running += 1
+                try:
+                    code = await proc.wait()
+                except asyncio.CancelledError:
+                    proc.kill()
+                    raise
+                finally:
+                    self.running -= 1
+                if code != 0:
+                    raise OSError(f"ffmpeg exited with {code}")
+                await asyncio.get_running_loop().run_in_executor(None, self._commit, part, video_id)
+            except Exception:
+                self.stats["failed"] += 1
+                self._discard(part)
+                return
+            except asyncio.CancelledError:
+                self._discard(part)
+                raise
+        size = os.path.getsize(self._path(video_id))
+        self._entries[video_id] = size
+        self._bytes += size
+        self.stats["fills"] += 1
+        self._evict()
+        for hook in self.on_fill:
+            hook(video_id, self._path(video_id))
+
+    def _commit(self, part: str, video_id: str):
+        with open(part, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(part, self._path(video_id))
+
+    @staticmethod
+    def _discard(path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        # Files still open by a playing FFmpeg keep working after the unlink.
+        while self._bytes > self.max_bytes and self._entries:
+            video_id, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self._discard(self._path(video_id))
+            self.stats["evicted"] += 1
@@ -0,0 +1,92 @@
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracks import Track, TrackQueue
+
+SIZES = (100, 1_000, 10_000)
+PAGE_SIZE = 10
+
+
+def make_dicts(n):
+    return [
+        {"title": f"Song {i}", "url": f"https://www.youtube.com/watch?v={i:011d}",
+         "duration": 200, "thumbnail": None, "user": "bench"}
+        for i in range(n)
+    ]
+
+
+def make_queue(n):
+    return TrackQueue(
+        Track(f"Song {i}", f"https://www.youtube.com/watch?v={i:011d}", 200, None, "bench")
+        for i in range(n)
+    )
+
+
+def drain_list(q):
+    while q:
+        q.pop(0)
+
+
+def drain_queue(q):
+    while q:
+        q.popleft()
+
+
+def render_list(q):
+    return "\n".join(f"{i}. {song['title']}" for i, song in enumerate(q, start=1))
+
+
+def render_queue(q):
+    return "\n".join(f"{i}. {song.title}" for i, song in q.page(q.page_count(PAGE_SIZE), PAGE_SIZE))
+
+
+def remove_middle_list(q):
+    for _ in range(100):
+        q.pop(len(q) // 2)
+
+
+def remove_middle_queue(q):
+    for _ in range(100):
+        q.remove_at(len(q) // 2)
+
+
+def memory(factory, n):
+    tracemalloc.start()
+    obj = factory(n)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return size
+
+
+def bench(label, setup, fn, n, number=5):
+    total = 0.0
+    for _ in range(number):
+        q = setup(n)
+        total += timeit.timeit(lambda: fn(q), number=1)
+    print(f"  {label:<28} {total / number * 1e3:10.3f} ms")
+
+
+def main():
+    random.seed(0)
+    for n in SIZES:
+        print(f"n = {n}")
+        bench("drain list.pop(0)", make_dicts, drain_list, n)
+        bench("drain TrackQueue.popleft", make_queue, drain_queue, n)
+        bench("shuffle list", make_dicts, random.shuffle, n)
+        bench("shuffle TrackQueue", make_queue, TrackQueue.shuffle, n)
+        bench("remove 100 middle list", make_dicts, remove_middle_list, max(n, 100))
+        bench("remove 100 middle TrackQueue", make_queue, remove_middle_queue, max(n, 100))
+        bench("render full list", make_dicts, render_list, n)
+        bench("render last page TrackQueue", make_queue, render_queue, n)
+        print(f"  {'memory list-of-dicts':<28} {memory(make_dicts, n) / 1024:10.1f} KiB")
+        print(f"  {'memory TrackQueue':<28} {memory(make_queue, n) / 1024:10.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
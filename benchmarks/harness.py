@@ -0,0 +1,441 @@
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import defaultdict
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord
+import lyricsgenius
+import yt_dlp
+from discord.ext import commands
+from discord.ext.commands.view import StringView
+
+import main
+from resolver import SearchResolver
+
+OPUS_SILENCE = b"\xf8\xff\xfe"
+ROLE_NAME = "DJ"
+_ids = itertools.count(1)
+
+
+class Delays:
+    extract = 0.3
+    playlist_page = 0.2
+    scrape = 0.15
+    genius = 0.3
+    connect = 0.5
+    rest = 0.05
+    track = 3.0
+    pick = 1.0
+
+
+def fake_video_id(text: str) -> str:
+    return f"{abs(hash(text)) % 10**11:011d}"
+
+
+class StubYoutubeDL:
+    playlist_size = 200
+    page_size = 100
+
+    def __init__(self, opts=None):
+        self.opts = opts or {}
+
+    def extract_info(self, url, download=False, process=True):
+        if "list=" in url and not self.opts.get("noplaylist"):
+            return {"_type": "playlist", "entries": self._playlist(url)}
+        time.sleep(Delays.extract)
+        if url.startswith("ytsearch"):
+            query = url.partition(":")[2]
+            return {"entries": [self._info(fake_video_id(f"{query}{i}")) for i in range(5)]}
+        return self._info(url.rpartition("v=")[2][:11] or fake_video_id(url))
+
+    def _playlist(self, url):
+        for page in range(0, self.playlist_size, self.page_size):
+            time.sleep(Delays.playlist_page)
+            for i in range(page, min(page + self.page_size, self.playlist_size)):
+                yield {"id": fake_video_id(f"{url}#{i}"), "title": f"{url} #{i}", "duration": 180}
+
+    @staticmethod
+    def _info(video_id):
+        return {
+            "id": video_id,
+            "title": f"Track {video_id}",
+            "duration": 180,
+            "thumbnail": None,
+            "url": f"https://stub.invalid/{video_id}",
+        }
+
+
+class StubGenius:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def search_song(self, title, artist=""):
+        time.sleep(Delays.genius)
+        return None
+
+
+async def fake_scrape(self, query):
+    await asyncio.sleep(Delays.scrape)
+    return fake_video_id(query)
+
+
+class DummyAudio(discord.AudioSource):
+    def __init__(self, source, **kwargs):
+        self.source = source
+
+    def read(self) -> bytes:
+        return OPUS_SILENCE
+
+    def is_opus(self) -> bool:
+        return True
+
+
+class FakeMessage:
+    def __init__(self, channel, author=None, content=""):
+        self.id = next(_ids)
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.attachments = []
+        self._state = None
+
+    async def edit(self, **kwargs):
+        await asyncio.sleep(Delays.rest)
+        return self
+
+    async def add_reaction(self, emoji):
+        await asyncio.sleep(Delays.rest)
+        member = self.guild.member
+        if emoji == "1️⃣" and member is not None:
+            # A !search result list: the member picks the first option a little later.
+            asyncio.ensure_future(member.react(self, emoji, Delays.pick))
+
+    async def remove_reaction(self, emoji, member):
+        await asyncio.sleep(Delays.rest)
+
+    async def delete(self):
+        await asyncio.sleep(Delays.rest)
+
+
+class FakeTextChannel:
+    def __init__(self, guild):
+        self.id = next(_ids)
+        self.guild = guild
+
+    async def send(self, content=None, **kwargs):
+        await asyncio.sleep(Delays.rest)
+        return FakeMessage(self)
+
+    async def fetch_message(self, message_id):
+        await asyncio.sleep(Delays.rest)
+        return FakeMessage(self)
+
+    def get_partial_message(self, message_id):
+        message = FakeMessage(self)
+        message.id = message_id
+        return message
+
+
+class FakeVoiceClient:
+    def __init__(self, channel):
+        self.channel = channel
+        self.source = None
+        self._after = None
+        self._task = None
+        self._paused = False
+        self._connected = True
+
+    def is_connected(self):
+        return self._connected
+
+    def is_playing(self):
+        return self.source is not None and not self._paused
+
+    def is_paused(self):
+        return self.source is not None and self._paused
+
+    def play(self, source, *, after=None):
+        if self.source is not None:
+            raise discord.ClientException("Already playing audio.")
+        self.source = source
+        self._after = after
+        self._paused = False
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        try:
+            await asyncio.sleep(0.02)
+            self.source.read()
+            await asyncio.sleep(Delays.track)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._finish()
+
+    def _finish(self):
+        source, self.source = self.source, None
+        if source is not None:
+            source.cleanup()
+        after, self._after = self._after, None
+        if after is not None:
+            # discord.py calls `after` from the audio player thread.
+            threading.Thread(target=after, args=(None,), daemon=True).start()
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._finish()
+
+    async def disconnect(self, *, force=False):
+        self._connected = False
+        self.stop()
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild):
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = f"voice-{self.id}"
+
+    async def connect(self, **kwargs):
+        await asyncio.sleep(Delays.connect)
+        return FakeVoiceClient(self)
+
+
+class FakeGuild:
+    def __init__(self, client):
+        self.id = next(_ids)
+        self.client = client
+        self.text = FakeTextChannel(self)
+        self.voice = FakeVoiceChannel(self)
+        self.voice_client = None
+        self.member = None
+
+    def get_channel(self, channel_id):
+        return {self.text.id: self.text, self.voice.id: self.voice}.get(channel_id)
+
+
+class FakeRole:
+    def __init__(self, name):
+        self.id = next(_ids)
+        self.name = name
+
+
+class FakeMember:
+    def __init__(self, guild):
+        self.id = next(_ids)
+        self.guild = guild
+        self.display_name = f"user-{self.id}"
+        self.bot = False
+        self.roles = [FakeRole(ROLE_NAME)]
+        self.voice = type("VoiceState", (), {"channel": guild.voice})()
+        guild.member = self
+
+    async def react(self, message, emoji, delay):
+        await asyncio.sleep(delay)
+        # Goes through the gateway event handler, like a real reaction would.
+        self.guild.client.dispatch("raw_reaction_add", FakeReactionEvent(message, self, emoji))
+
+
+class FakeReactionEvent:
+    def __init__(self, message, member, emoji):
+        self.message_id = message.id
+        self.channel_id = message.channel.id
+        self.guild_id = message.guild.id
+        self.user_id = member.id
+        self.member = member
+        self.emoji = emoji
+
+
+class FakeContext(commands.Context):
+    # The real Context, minus the HTTP calls.
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+    async def fetch_message(self, message_id):
+        return await self.channel.fetch_message(message_id)
+
+
+WORKLOAD = (
+    ("play", 40),
+    ("queue", 25),
+    ("skip", 15),
+    ("np", 15),
+    ("playlist", 5),
+    ("search", 5),
+)
+
+
+def command_args(name, rng):
+    if name == "play":
+        if rng.random() < 0.3:
+            return f"some song {rng.randrange(500)}"
+        return f"https://www.youtube.com/watch?v={rng.randrange(2000):011d}"
+    if name == "playlist":
+        return f"https://www.youtube.com/playlist?list=PL{rng.randrange(20)}"
+    if name == "search":
+        return f"some song {rng.randrange(500)}"
+    return ""
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def measure_loop_lag(samples, stop, interval=0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(loop.time() - start - interval)
+
+
+async def guild_worker(client, guild, rng, deadline, think, latencies, errors):
+    member = FakeMember(guild)
+    names, weights = zip(*WORKLOAD)
+    loop = asyncio.get_running_loop()
+    while loop.time() < deadline:
+        name = rng.choices(names, weights)[0]
+        args = command_args(name, rng)
+        message = FakeMessage(guild.text, member, f"!{name} {args}".strip())
+        command = client.get_command(name)
+        ctx = FakeContext(message=message, bot=client, view=StringView(args), prefix="!",
+                          command=command, invoked_with=name)
+        started = time.perf_counter()
+        try:
+            # Command.invoke runs the checks, argument parsing and before/after invoke hooks,
+            # and unlike Bot.invoke lets errors propagate instead of dispatching them.
+            await command.invoke(ctx)
+        except commands.CommandInvokeError as e:
+            errors[(name, type(e.original).__name__)] += 1
+        except Exception as e:
+            errors[(name, type(e).__name__)] += 1
+        latencies[name].append(time.perf_counter() - started)
+        await asyncio.sleep(rng.expovariate(1 / think))
+
+
+async def run(args):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lag = []
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    if args.trace_memory:
+        tracemalloc.start()
+    def on_background_error(loop, context):
+        # Failures in tasks the handlers spawn (playback transitions, fire-and-forget work)
+        # count the same as a command raising.
+        exc = context.get("exception")
+        errors[("background", type(exc).__name__ if exc else context["message"])] += 1
+        loop.default_exception_handler(context)
+
+    async def on_event_error(event, *args, **kwargs):
+        errors[(event, sys.exc_info()[0].__name__)] += 1
+        traceback.print_exc()
+
+    loop.set_exception_handler(on_background_error)
+    client = main.build_bot()
+    client.loop = loop
+    client.on_error = on_event_error
+    # Normally set at login; the reaction handler uses it to ignore the bot's own reactions.
+    client._connection.user = type("ClientUser", (), {"id": next(_ids), "bot": True})()
+    client.watchdog.threshold = args.stall_threshold
+    client.watchdog.strict = not args.allow_stalls
+    client.watchdog.start(loop)
+    guilds = [FakeGuild(client) for _ in range(args.guilds)]
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    lag_task = asyncio.ensure_future(measure_loop_lag(lag, stop))
+    deadline = loop.time() + args.duration
+    rng = random.Random(args.seed)
+    workers = [
+        guild_worker(client, g, random.Random(rng.random()), deadline, args.think, latencies, errors)
+        for g in guilds
+    ]
+    await asyncio.gather(*workers)
+    peak_state = tracemalloc.get_traced_memory()[0] - baseline
+    report = client.sessions.memory_report()
+
+    stop.set()
+    await lag_task
+    client.watchdog.stop()
+    for session in list(client.sessions):
+        client.sessions.teardown(session.guild_id)
+    tracemalloc.stop()
+
+    print(f"{args.guilds} guilds, {args.duration:.0f}s, think time {args.think:.1f}s")
+    print(f"{'command':<10} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, values in sorted(latencies.items()):
+        print(f"{name:<10} {len(values):>6} {percentile(values, 0.5) * 1e3:>9.1f} "
+              f"{percentile(values, 0.95) * 1e3:>9.1f} {percentile(values, 0.99) * 1e3:>9.1f}")
+    for label, hist in sorted(client.metrics.family("time_to_first_audio_seconds").items()):
+        print(f"time to first audio ({label}): p50 <= {hist.quantile(0.5) * 1e3:.0f} ms, "
+              f"p95 <= {hist.quantile(0.95) * 1e3:.0f} ms, n={hist.count}")
+    print(f"event loop lag: p50 {percentile(lag, 0.5) * 1e3:.2f} ms, p99 {percentile(lag, 0.99) * 1e3:.2f} ms, "
+          f"max {max(lag, default=0) * 1e3:.2f} ms")
+    print(f"memory: {report['session_bytes'] / max(report['sessions'], 1) / 1024:.1f} KiB session state "
+          f"per active guild ({report['sessions']} active)")
+    if args.trace_memory:
+        print(f"memory: {peak_state / max(args.guilds, 1) / 1024:.1f} KiB traced per guild")
+    for (name, error), count in sorted(errors.items()):
+        print(f"error: {name} raised {error} x{count}")
+    for stall in client.watchdog.violations:
+        print(f"stall: event loop blocked for {stall.duration * 1e3:.0f} ms in {stall.task}\n{stall.stack}")
+    return 1 if errors or client.watchdog.violations else 0
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Drive the bot's command handlers against local fakes.")
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds between commands per guild")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="attribute allocations with tracemalloc (slow)")
+    parser.add_argument("--stall-threshold", type=float, default=0.1,
+                        help="event loop stalls longer than this many seconds fail the run")
+    parser.add_argument("--allow-stalls", action="store_true", help="report stalls without failing the run")
+    for name in ("extract", "playlist_page", "scrape", "genius", "connect", "rest", "track", "pick"):
+        parser.add_argument(f"--{name.replace('_', '-')}-delay", type=float, default=getattr(Delays, name), dest=name)
+    args = parser.parse_args()
+    for name in ("extract", "playlist_page", "scrape", "genius", "connect", "rest", "track", "pick"):
+        setattr(Delays, name, getattr(args, name))
+
+    workdir = tempfile.mkdtemp(prefix="musicbot-bench-")
+    os.environ.update({
+        "ROLE_NAME": ROLE_NAME,
+        "CACHE_DB": os.path.join(workdir, "cache.db"),
+        "JOURNAL_PATH": os.path.join(workdir, "journal"),
+        "PREFETCH_WARM": "0",
+        "LOUDNESS_NORMALIZE": "0",
+    })
+    with mock.patch.object(yt_dlp, "YoutubeDL", StubYoutubeDL), \
+            mock.patch.object(lyricsgenius, "Genius", StubGenius), \
+            mock.patch.object(main.discord, "FFmpegOpusAudio", DummyAudio), \
+            mock.patch.object(SearchResolver, "_scrape", fake_scrape):
+        sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main_cli()
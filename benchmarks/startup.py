@@ -0,0 +1,68 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import time
+import main
+client = main.build_bot()
+started = main.PROCESS_START
+print("phase imports", main.IMPORTS_DONE - started)
+print("phase build", time.perf_counter() - started)
+"""
+
+
+def run_once(env):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    phases = {}
+    for line in proc.stdout.splitlines():
+        if line.startswith("phase "):
+            _, name, seconds = line.split()
+            phases[name] = float(seconds)
+    packages = defaultdict(int)
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us)
+    return phases, packages
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Measure cold-start import and build time in fresh interpreters.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="number of top-level packages to list")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="musicbot-startup-")
+    env = dict(os.environ, CACHE_DB=os.path.join(workdir, "cache.db"), JOURNAL_PATH=os.path.join(workdir, "journal"))
+    phases = defaultdict(list)
+    packages = defaultdict(list)
+    for _ in range(args.runs):
+        run_phases, run_packages = run_once(env)
+        for name, seconds in run_phases.items():
+            phases[name].append(seconds)
+        for name, us in run_packages.items():
+            packages[name].append(us)
+
+    print(f"{args.runs} cold starts (median, measured from the top of main.py)")
+    for name, values in phases.items():
+        print(f"  {name:<10} {sorted(values)[len(values) // 2] * 1e3:>8.1f} ms")
+    print("slowest top-level imports (median self time, all submodules)")
+    ranked = sorted(packages.items(), key=lambda item: -sorted(item[1])[len(item[1]) // 2])
+    for name, values in ranked[:args.top]:
+        print(f"  {name:<20} {sorted(values)[len(values) // 2] / 1e3:>8.1f} ms")
+    for lazy in ("yt_dlp", "lyricsgenius"):
+        print(f"  {lazy} imported at startup: {'yes' if lazy in packages else 'no'}")
+
+
+if __name__ == "__main__":
+    main_cli()
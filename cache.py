@@ -0,0 +1,162 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MetadataCache:
+    TRACK_FIELDS = ("title", "duration", "thumbnail")
+
+    def __init__(self, path: str, max_tracks: int = 4096, max_queries: int = 4096,
+                 query_ttl: float = 7 * 24 * 3600):
+        self.tracks = LRUCache(max_tracks)
+        self.gains = LRUCache(max_tracks)
+        self.queries = LRUCache(max_queries)
+        self.query_ttl = query_ttl
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            "id TEXT PRIMARY KEY, title TEXT, duration INTEGER, thumbnail TEXT, updated REAL, gain REAL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(tracks)")}
+        if "gain" not in columns:
+            self._db.execute("ALTER TABLE tracks ADD COLUMN gain REAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS queries ("
+            "query TEXT PRIMARY KEY, value TEXT, updated REAL)"
+        )
+
+    def _query_db(self, sql, args=()):
+        with self._lock:
+            return self._db.execute(sql, args).fetchone()
+
+    def _write_db(self, sql, args):
+        with self._lock:
+            self._db.execute(sql, args)
+
+    def _count(self, hit, disk=False):
+        if not hit:
+            self.stats["misses"] += 1
+        elif disk:
+            self.stats["disk_hits"] += 1
+        else:
+            self.stats["hits"] += 1
+
+    def get_track(self, video_id: str):
+        info = self.tracks.get(video_id)
+        if info is not None:
+            self._count(True)
+            return info
+        row = self._query_db(
+            "SELECT title, duration, thumbnail FROM tracks WHERE id = ?", (video_id,)
+        )
+        if row is None:
+            self._count(False)
+            return None
+        info = dict(zip(self.TRACK_FIELDS, row))
+        self.tracks.put(video_id, info)
+        self._count(True, disk=True)
+        return info
+
+    def put_track(self, video_id: str, data: dict):
+        if not video_id or not data.get("title"):
+            return
+        info = {
+            "title": data["title"],
+            "duration": int(data.get("duration") or 0),
+            "thumbnail": data.get("thumbnail") or thumbnail_of(data),
+        }
+        self.tracks.put(video_id, info)
+        # Upsert rather than replace so a measured gain survives metadata refreshes.
+        self._write_db(
+            "INSERT INTO tracks (id, title, duration, thumbnail, updated) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET title = excluded.title, duration = excluded.duration, "
+            "thumbnail = excluded.thumbnail, updated = excluded.updated",
+            (video_id, info["title"], info["duration"], info["thumbnail"], time.time()),
+        )
+
+    def get_gain(self, video_id: str):
+        gain = self.gains.get(video_id)
+        if gain is not None:
+            return gain
+        row = self._query_db("SELECT gain FROM tracks WHERE id = ?", (video_id,))
+        if row is None or row[0] is None:
+            return None
+        self.gains.put(video_id, row[0])
+        return row[0]
+
+    def put_gain(self, video_id: str, gain: float):
+        self.gains.put(video_id, gain)
+        self._write_db("UPDATE tracks SET gain = ? WHERE id = ?", (gain, video_id))
+
+    def get_query(self, key: str):
+        value = self.queries.get(key)
+        if value is not None:
+            self._count(True)
+            return value
+        row = self._query_db(
+            "SELECT value FROM queries WHERE query = ? AND updated > ?",
+            (key, time.time() - self.query_ttl),
+        )
+        if row is None:
+            self._count(False)
+            return None
+        self.queries.put(key, row[0])
+        self._count(True, disk=True)
+        return row[0]
+
+    def put_query(self, key: str, value: str):
+        self.queries.put(key, value)
+        self._write_db(
+            "INSERT OR REPLACE INTO queries (query, value, updated) VALUES (?, ?, ?)",
+            (key, value, time.time()),
+        )
+
+    def hit_rate(self) -> float:
+        hits = self.stats["hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def thumbnail_of(data: dict):
+    thumbs = data.get("thumbnails") or []
+    return thumbs[-1].get("url") if thumbs else None
@@ -0,0 +1,196 @@
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+INTERACTIVE = 0
+PREFETCH = 1
+BULK = 2
+PRIORITY_NAMES = ("interactive", "prefetch", "bulk")
+
+
+class _Job:
+    __slots__ = ("key", "fn", "guild_id", "priority", "profile", "future", "waiters", "started")
+
+    def __init__(self, key, fn, guild_id, priority, profile, future):
+        self.key = key
+        self.fn = fn
+        self.guild_id = guild_id
+        self.priority = priority
+        self.profile = profile
+        self.future = future
+        self.waiters = 0
+        self.started = False
+
+
+class ExtractionScheduler:
+    def __init__(self, factory, profiles: dict, workers: int = 4, timeout: float = 30.0,
+                 long_workers: int = 2):
+        # Threads rather than processes: extraction is mostly network-bound, and info dicts
+        # would otherwise have to be pickled back across the process boundary.
+        self.factory = factory
+        self.profiles = profiles
+        self.workers = workers
+        self.timeout = timeout
+        # One worker is always left free for interactive requests.
+        self.background_limit = max(workers - 1, 1)
+        self.stats = {"submitted": 0, "merged": 0, "cancelled": 0, "timeouts": 0}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extract")
+        # Long-lived reads such as playlist pages get their own threads so they never hold
+        # a worker the short extractions need.
+        self._long_pool = ThreadPoolExecutor(max_workers=long_workers, thread_name_prefix="extract-long")
+        self._local = threading.local()
+        self._queues = [OrderedDict() for _ in PRIORITY_NAMES]
+        self._inflight = {}
+        self._running = 0
+        self._background = 0
+
+    def _instance(self, profile: str):
+        instances = getattr(self._local, "instances", None)
+        if instances is None:
+            instances = self._local.instances = {}
+        ytdl = instances.get(profile)
+        if ytdl is None:
+            # yt-dlp instances aren't safe to share between threads, so each worker gets its own.
+            ytdl = instances[profile] = self.factory(self.profiles[profile])
+        return ytdl
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def depth(self) -> dict:
+        return {
+            name: sum(len(jobs) for jobs in queue.values())
+            for name, queue in zip(PRIORITY_NAMES, self._queues)
+        }
+
+    async def warm(self):
+        # Loads yt-dlp and builds a YoutubeDL per worker ahead of the first real request.
+        await asyncio.gather(
+            *(self.run(lambda ytdl: None, priority=BULK) for _ in range(self.workers)),
+            return_exceptions=True,
+        )
+
+    async def extract(self, url: str, guild_id=None, priority: int = INTERACTIVE,
+                      profile: str = "default", timeout: float = None, process: bool = True):
+        return await self.run(
+            lambda ytdl: ytdl.extract_info(url, download=False, process=process),
+            guild_id=guild_id, priority=priority, profile=profile, timeout=timeout,
+            key=(profile, url, process),
+        )
+
+    async def run_long(self, fn, profile: str = "default", timeout: float = None):
+        # Not queued, merged or prioritized; excess calls wait for a free long-lived thread.
+        return await asyncio.wait_for(
+            asyncio.get_running_loop().run_in_executor(self._long_pool, self._call, fn, profile),
+            timeout or self.timeout,
+        )
+
+    async def run(self, fn, guild_id=None, priority: int = INTERACTIVE, profile: str = "default",
+                  timeout: float = None, key=None):
+        job = self._inflight.get(key) if key is not None else None
+        if job is None:
+            job = _Job(key, fn, guild_id, priority, profile, asyncio.get_running_loop().create_future())
+            if key is not None:
+                self._inflight[key] = job
+            self._enqueue(job)
+            self.stats["submitted"] += 1
+        else:
+            self.stats["merged"] += 1
+            if priority < job.priority and not job.started:
+                self._dequeue(job)
+                job.priority = priority
+                self._enqueue(job)
+        self._pump()
+
+        job.waiters += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(job.future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise
+        finally:
+            job.waiters -= 1
+            if not job.waiters and not job.future.done():
+                self._abandon(job)
+
+    def _enqueue(self, job: _Job):
+        queue = self._queues[job.priority]
+        jobs = queue.get(job.guild_id)
+        if jobs is None:
+            jobs = queue[job.guild_id] = deque()
+        jobs.append(job)
+
+    def _dequeue(self, job: _Job):
+        queue = self._queues[job.priority]
+        jobs = queue.get(job.guild_id)
+        if jobs is None:
+            return
+        try:
+            jobs.remove(job)
+        except ValueError:
+            return
+        if not jobs:
+            del queue[job.guild_id]
+
+    def _abandon(self, job: _Job):
+        # Nobody is waiting any more. A queued job is dropped; a running one can't be
+        # interrupted, so its result is simply discarded when it lands.
+        if not job.started:
+            self._dequeue(job)
+            job.future.cancel()
+            self.stats["cancelled"] += 1
+        if job.key is not None and self._inflight.get(job.key) is job:
+            del self._inflight[job.key]
+
+    def _next_job(self):
+        for priority, queue in enumerate(self._queues):
+            if not queue:
+                continue
+            if priority != INTERACTIVE and self._background >= self.background_limit:
+                return None
+            # Round-robin across guilds within a priority class.
+            guild_id, jobs = next(iter(queue.items()))
+            job = jobs.popleft()
+            if jobs:
+                queue.move_to_end(guild_id)
+            else:
+                del queue[guild_id]
+            return job
+        return None
+
+    def _pump(self):
+        loop = asyncio.get_running_loop()
+        while self._running < self.workers:
+            job = self._next_job()
+            if job is None:
+                return
+            job.started = True
+            self._running += 1
+            if job.priority != INTERACTIVE:
+                self._background += 1
+            fut = loop.run_in_executor(self._pool, self._call, job.fn, job.profile)
+            fut.add_done_callback(lambda f, job=job: self._finish(job, f))
+
+    def _call(self, fn, profile):
+        return fn(self._instance(profile))
+
+    def _finish(self, job: _Job, fut):
+        self._running -= 1
+        if job.priority != INTERACTIVE:
+            self._background -= 1
+        if job.key is not None and self._inflight.get(job.key) is job:
+            del self._inflight[job.key]
+        if not job.future.done():
+            if fut.cancelled():
+                job.future.cancel()
+            elif fut.exception() is not None:
+                job.future.set_exception(fut.exception())
+            else:
+                job.future.set_result(fut.result())
+        self._pump()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._long_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+
+_DONE = object()
+
+
+async def stream_entries(run, url: str):
+    # `run` hands pump() a worker thread and that thread's YoutubeDL instance.
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def pump(ytdl):
+        try:
+            info = ytdl.extract_info(url, download=False, process=False)
+            # Playlist links inside watch URLs come back as redirects; follow them unprocessed.
+            for _ in range(3):
+                if not info or info.get("_type") not in ("url", "url_transparent"):
+                    break
+                info = ytdl.extract_info(info["url"], download=False, process=False)
+            for entry in (info or {}).get("entries") or ():
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, entry)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+    task = asyncio.ensure_future(run(pump))
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        task.cancel()
+
+
+class BoundedWorkers:
+    def __init__(self, concurrency: int):
+        self._sem = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+        self.done = 0
+        self.failed = 0
+
+    def submit(self, factory):
+        task = asyncio.ensure_future(self._run(factory))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, factory):
+        async with self._sem:
+            try:
+                await factory()
+            except Exception:
+                self.failed += 1
+            else:
+                self.done += 1
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def join(self):
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def cancel(self):
+        for task in self._tasks:
+            task.cancel()
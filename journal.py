@@ -0,0 +1,180 @@
+import asyncio
+import json
+import os
+import random
+import time
+
+from tracks import Track
+
+
+def pack_track(track: Track) -> list:
+    return [track.title, track.url, track.duration, track.thumbnail, track.user]
+
+
+def unpack_track(data: list) -> Track:
+    return Track(*data)
+
+
+class GuildState:
+    __slots__ = ("queue", "current", "started", "channel_id", "voice_id")
+
+    def __init__(self):
+        self.queue = []
+        self.current = None
+        self.started = None
+        self.channel_id = None
+        self.voice_id = None
+
+
+class Journal:
+    def __init__(self, path: str, fsync_interval: float = 5.0):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.records = 0
+        self._file = None
+        self._last_sync = 0.0
+        self._compactor = None
+        self._held = None
+
+    def open(self):
+        self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, record: list):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        if self._held is not None:
+            self._held.append(line)
+            return
+        if self._file is None:
+            return
+        self._file.write(line)
+        self.records += 1
+        now = time.monotonic()
+        if now - self._last_sync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_sync = now
+
+    def push(self, guild_id: int, track: Track):
+        self._write(["push", guild_id, pack_track(track)])
+
+    def pop(self, guild_id: int):
+        self._write(["pop", guild_id])
+
+    def remove(self, guild_id: int, index: int):
+        self._write(["del", guild_id, index])
+
+    def move(self, guild_id: int, src: int, dst: int):
+        self._write(["move", guild_id, src, dst])
+
+    def shuffle(self, guild_id: int, seed: int):
+        # Recording the seed keeps a shuffle O(1) to journal; replay reproduces the same order.
+        self._write(["shuf", guild_id, seed])
+
+    def clear(self, guild_id: int):
+        self._write(["clear", guild_id])
+
+    def playing(self, guild_id: int, track: Track, started: float, channel_id: int, voice_id: int):
+        self._write(["play", guild_id, pack_track(track), started, channel_id, voice_id])
+
+    def end(self, guild_id: int):
+        self._write(["end", guild_id])
+
+    def replay(self) -> dict:
+        states = {}
+        try:
+            f = open(self.path, encoding="utf-8")
+        except FileNotFoundError:
+            return states
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write; everything before it is intact.
+                    continue
+                op, guild_id, args = record[0], record[1], record[2:]
+                if op == "end":
+                    states.pop(guild_id, None)
+                    continue
+                state = states.get(guild_id)
+                if state is None:
+                    state = states[guild_id] = GuildState()
+                try:
+                    self._apply(state, op, args)
+                except (IndexError, TypeError):
+                    continue
+        return states
+
+    @staticmethod
+    def _apply(state: GuildState, op: str, args: list):
+        q = state.queue
+        if op == "push":
+            q.append(args[0])
+        elif op == "pop":
+            q.pop(0)
+        elif op == "del":
+            del q[args[0]]
+        elif op == "move":
+            q.insert(args[1], q.pop(args[0]))
+        elif op == "shuf":
+            random.Random(args[0]).shuffle(q)
+        elif op == "clear":
+            q.clear()
+        elif op == "snap":
+            state.queue = list(args[0])
+        elif op == "play":
+            state.current, state.started, state.channel_id, state.voice_id = args
+
+    def snapshot_records(self, sessions) -> list:
+        lines = []
+        for session in sessions:
+            if not session.queue and session.current is None:
+                continue
+            gid = session.guild_id
+            lines.append(["snap", gid, [pack_track(t) for t in session.queue]])
+            if session.current is not None and session.started_at is not None and session.is_connected():
+                lines.append([
+                    "play", gid, pack_track(session.current), session.started_at.timestamp(),
+                    session.channel.id, session.voice_client.channel.id,
+                ])
+        return lines
+
+    async def compact(self, sessions):
+        # Serialize on the loop so the snapshot is consistent, then do the file I/O off it.
+        data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in self.snapshot_records(sessions))
+        tmp = self.path + ".tmp"
+
+        def write():
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+        # Records written while the snapshot is on its way to disk belong after it.
+        self._held = []
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, write)
+            self.close()
+            os.replace(tmp, self.path)
+            self.records = data.count("\n")
+        finally:
+            if self._file is None:
+                self.open()
+            held, self._held = self._held, None
+            for line in held:
+                self._file.write(line)
+                self.records += 1
+
+    def start_compactor(self, sessions, interval: float = 300.0, min_records: int = 1000):
+        async def compact_forever():
+            while True:
+                await asyncio.sleep(interval)
+                if self.records >= min_records:
+                    await self.compact(sessions)
+
+        if self._compactor is None or self._compactor.done():
+            self._compactor = asyncio.ensure_future(compact_forever())
@@ -0,0 +1,81 @@
+import asyncio
+import time
+import urllib.parse
+
+from cache import LRUCache
+from extractor import INTERACTIVE, PREFETCH
+
+
+def url_expiry(stream_url: str):
+    values = urllib.parse.parse_qs(urllib.parse.urlparse(stream_url).query).get("expire")
+    try:
+        return float(values[0]) if values else None
+    except ValueError:
+        return None
+
+
+def stream_failed(source) -> bool:
+    # discord.py calls `after` before cleanup, so an FFmpeg that is still running was
+    # stopped on purpose; one that already exited non-zero lost its stream.
+    while source is not None and not hasattr(source, "_process"):
+        source = getattr(source, "source", None)
+    process = getattr(source, "_process", None)
+    poll = getattr(process, "poll", None)
+    return poll is not None and poll() not in (None, 0)
+
+
+class StreamLeases:
+    def __init__(self, resolve, margin: float = 120.0, refresh_ahead: float = 1800.0,
+                 default_ttl: float = 3600.0, max_entries: int = 1024):
+        self.resolve = resolve
+        self.margin = margin
+        self.refresh_ahead = refresh_ahead
+        self.default_ttl = default_ttl
+        self.leases = LRUCache(max_entries)
+        self.stats = {"reused": 0, "resolved": 0, "refreshed": 0, "invalidated": 0}
+        self._refreshing = {}
+
+    def fresh(self, stream_url: str) -> bool:
+        expires = url_expiry(stream_url)
+        return expires is None or expires - time.time() > self.margin
+
+    def put(self, url: str, stream_url: str):
+        expires = url_expiry(stream_url) or time.time() + self.default_ttl
+        self.leases.put(url, (stream_url, expires))
+
+    def invalidate(self, url: str):
+        if self.leases.pop(url) is not None:
+            self.stats["invalidated"] += 1
+
+    async def get(self, url: str, guild_id=None, priority: int = INTERACTIVE) -> str:
+        lease = self.leases.get(url)
+        if lease is not None:
+            stream_url, expires = lease
+            remaining = expires - time.time()
+            if remaining > self.margin:
+                self.stats["reused"] += 1
+                if remaining < self.refresh_ahead:
+                    self._refresh(url, guild_id)
+                return stream_url
+        return await self._resolve(url, guild_id, priority)
+
+    async def _resolve(self, url: str, guild_id, priority: int) -> str:
+        stream_url = await self.resolve(url, guild_id, priority)
+        self.put(url, stream_url)
+        self.stats["resolved"] += 1
+        return stream_url
+
+    def _refresh(self, url: str, guild_id):
+        # Still usable, but close enough to expiry to renew in the background.
+        if url in self._refreshing:
+            return
+        task = asyncio.ensure_future(self._resolve(url, guild_id, PREFETCH))
+        self._refreshing[url] = task
+        self.stats["refreshed"] += 1
+
+        def done(t):
+            self._refreshing.pop(url, None)
+            if not t.cancelled():
+                t.exception()
+
+        task.add_done_callback(done)
@@ -0,0 +1,142 @@
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from lyrics import clean_title
+
+WORD_RE = re.compile(r"\w+")
+
+
+def normalize_title(title: str) -> str:
+    song, artist = clean_title(title)
+    return " ".join(WORD_RE.findall(f"{artist} {song}".lower()))
+
+
+def trigrams(text: str) -> set:
+    grams = set()
+    for word in text.split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrackLibrary:
+    def __init__(self, path: str, min_coverage: float = 0.9, min_precision: float = 0.5,
+                 min_words: int = 2, min_margin: float = 0.1):
+        self.min_coverage = min_coverage
+        self.min_precision = min_precision
+        self.min_words = min_words
+        self.min_margin = min_margin
+        self.titles = {}
+        self.plays = Counter()
+        self.stats = {"local": 0, "remote": 0}
+        self._grams = {}
+        self._postings = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS library ("
+            "id TEXT PRIMARY KEY, title TEXT, plays INTEGER, last_played REAL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS guild_plays ("
+            "guild_id INTEGER, id TEXT, plays INTEGER, last_played REAL, PRIMARY KEY (guild_id, id))"
+        )
+        for video_id, title, plays in self._db.execute("SELECT id, title, plays FROM library"):
+            self._index(video_id, title)
+            self.plays[video_id] = plays
+
+    def __len__(self):
+        return len(self.titles)
+
+    def _index(self, video_id: str, title: str):
+        if self.titles.get(video_id) == title:
+            return
+        for gram in self._grams.pop(video_id, ()):
+            self._postings[gram].discard(video_id)
+        grams = trigrams(normalize_title(title))
+        self.titles[video_id] = title
+        self._grams[video_id] = grams
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(video_id)
+
+    def record(self, guild_id: int, video_id: str, title: str):
+        if not video_id or not title:
+            return
+        now = time.time()
+        self._index(video_id, title)
+        self.plays[video_id] += 1
+        with self._lock:
+            # One commit per play; in WAL mode with synchronous=NORMAL it doesn't wait on fsync.
+            self._db.execute("BEGIN")
+            # Commits on success and rolls back if either upsert fails.
+            with self._db:
+                self._db.execute(
+                    "INSERT INTO library (id, title, plays, last_played) VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET title = excluded.title, plays = plays + 1, "
+                    "last_played = excluded.last_played",
+                    (video_id, title, now),
+                )
+                self._db.execute(
+                    "INSERT INTO guild_plays (guild_id, id, plays, last_played) VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT(guild_id, id) DO UPDATE SET plays = plays + 1, last_played = excluded.last_played",
+                    (guild_id, video_id, now),
+                )
+
+    def match(self, query: str):
+        # Only answers when one previously played track clearly fits; anything less
+        # confident goes to the remote search instead.
+        words = WORD_RE.findall(query.lower())
+        grams = trigrams(" ".join(words))
+        # A lone artist or word ("queen", "hello") names many songs, most never played here.
+        if len(words) < self.min_words or len(grams) < 4:
+            self.stats["remote"] += 1
+            return None
+        overlap = Counter()
+        for gram in grams:
+            for video_id in self._postings.get(gram, ()):
+                overlap[video_id] += 1
+        scored = []
+        for video_id, shared in overlap.items():
+            coverage = shared / len(grams)
+            if coverage < self.min_coverage:
+                continue
+            # The query also has to account for a good part of the title, not just appear in it.
+            precision = shared / len(self._grams[video_id])
+            if precision < self.min_precision:
+                continue
+            scored.append((0.8 * coverage + 0.2 * precision + 0.05 * math.log1p(self.plays[video_id]), video_id))
+        if not scored:
+            self.stats["remote"] += 1
+            return None
+        scored.sort(reverse=True)
+        if len(scored) > 1 and scored[0][0] - scored[1][0] < self.min_margin:
+            self.stats["remote"] += 1
+            return None
+        self.stats["local"] += 1
+        return scored[0][1]
+
+    def history(self, guild_id: int, limit: int = 10) -> list:
+        with self._lock:
+            return self._db.execute(
+                "SELECT l.id, l.title, g.plays, g.last_played FROM guild_plays g JOIN library l ON l.id = g.id "
+                "WHERE g.guild_id = ? ORDER BY g.last_played DESC LIMIT ?",
+                (guild_id, limit),
+            ).fetchall()
+
+    def top(self, guild_id: int, limit: int = 10) -> list:
+        with self._lock:
+            return self._db.execute(
+                "SELECT l.id, l.title, g.plays, g.last_played FROM guild_plays g JOIN library l ON l.id = g.id "
+                "WHERE g.guild_id = ? ORDER BY g.plays DESC, g.last_played DESC LIMIT ?",
+                (guild_id, limit),
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import math
+import time
+
+BASE_VOLUME_DB = 20 * math.log10(0.25)
+
+
+def parse_loudnorm(output: str):
+    # loudnorm prints its measurements as the last JSON object on stderr.
+    start = output.rfind("{")
+    end = output.rfind("}")
+    if start == -1 or end < start:
+        return None
+    try:
+        return json.loads(output[start:end + 1])
+    except ValueError:
+        return None
+
+
+class LoudnessAnalyzer:
+    def __init__(self, cache, resolve=None, target: float = -14.0, max_peak: float = -1.0,
+                 max_boost: float = 10.0, concurrency: int = 1, max_pending: int = 8,
+                 retry_after: float = 3600.0):
+        # `resolve(video_id)` returns a playable stream URL, looked up when the analysis
+        # actually starts so a queued job never holds a URL that has since expired.
+        self.cache = cache
+        self.resolve = resolve
+        self.target = target
+        self.max_peak = max_peak
+        self.max_boost = max_boost
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.stats = {"analyzed": 0, "failed": 0, "dropped": 0}
+        self._sem = asyncio.Semaphore(concurrency)
+        self._pending = {}
+        self._failed = {}
+        self.running = 0
+
+    def gain_for(self, data: dict) -> float:
+        measured = float(data["input_i"])
+        peak = float(data["input_tp"])
+        if math.isinf(measured):
+            # Silence: nothing sensible to normalize to.
+            return 0.0
+        gain = min(self.target - measured, self.max_boost)
+        # Don't let a boost push true peaks into clipping.
+        return min(gain, self.max_peak - peak) if gain > 0 else gain
+
+    def analyze(self, video_id: str, path: str = None):
+        # `path` is a local copy when there is one; otherwise the stream is resolved later.
+        if not video_id or video_id in self._pending:
+            return
+        if path is None and self.resolve is None:
+            return
+        failed_at = self._failed.get(video_id)
+        if failed_at is not None:
+            if time.monotonic() - failed_at < self.retry_after:
+                return
+            del self._failed[video_id]
+        if self.cache.get_gain(video_id) is not None:
+            return
+        if len(self._pending) >= self.max_pending:
+            # Busy: skip it, the track is analysed the next time it plays.
+            self.stats["dropped"] += 1
+            return
+        task = asyncio.ensure_future(self._analyze(video_id, path))
+        self._pending[video_id] = task
+        task.add_done_callback(lambda _: self._pending.pop(video_id, None))
+
+    async def _analyze(self, video_id: str, path: str):
+        reconnect = ("-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5")
+        async with self._sem:
+            try:
+                source = path or await self.resolve(video_id)
+                proc = await asyncio.create_subprocess_exec(
+                    "ffmpeg", "-nostdin", "-hide_banner", "-nostats",
+                    *(reconnect if source.startswith("http") else ()),
+                    "-i", source, "-vn", "-af", "loudnorm=print_format=json", "-f", "null", "-",
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+                self.running += 1
+                try:
+                    _, stderr = await proc.communicate()
+                except asyncio.CancelledError:
+                    proc.kill()
+                    raise
+                finally:
+                    self.running -= 1
+                data = parse_loudnorm(stderr.decode(errors="replace")) if proc.returncode == 0 else None
+                gain = self.gain_for(data) if data else None
+            except Exception:
+                gain = None
+        if gain is None:
+            self._failed[video_id] = time.monotonic()
+            self.stats["failed"] += 1
+            return
+        self.cache.put_gain(video_id, round(gain, 2))
+        self.stats["analyzed"] += 1
@@ -0,0 +1,138 @@
+import asyncio
+import re
+import sqlite3
+import threading
+import time
+
+from cache import LRUCache
+
+NOISE_RE = re.compile(
+    r"[(\[][^)\]]*\b(official|video|audio|lyrics?|visuali[sz]er|hd|hq|4k|remaster(ed)?|mv|m/v)\b[^)\]]*[)\]]",
+    re.IGNORECASE,
+)
+FEAT_RE = re.compile(r"[(\[]?\b(feat|ft)\.?\s[^)\]\-|]*[)\]]?", re.IGNORECASE)
+
+
+def clean_title(title: str):
+    text = NOISE_RE.sub("", title)
+    text = FEAT_RE.sub("", text)
+    text = re.sub(r"\s*\|.*$", "", text)
+    text = " ".join(text.split())
+    artist, sep, song = text.partition(" - ")
+    if sep and song.strip():
+        return song.strip(), artist.strip()
+    return text, ""
+
+
+def paginate(text: str, size: int = 2048) -> list:
+    pages, current = [], ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > size:
+            if current:
+                pages.append(current)
+                current = ""
+            pages.append(line[:size])
+            line = line[size:]
+        if len(current) + len(line) > size:
+            pages.append(current)
+            current = ""
+        current += line
+    if current.strip():
+        pages.append(current)
+    return pages
+
+
+class LyricsService:
+    def __init__(self, make_genius, path: str, max_entries: int = 512, negative_ttl: float = 24 * 3600):
+        self.make_genius = make_genius
+        self._genius = None
+        self._genius_lock = threading.Lock()
+        self.negative_ttl = negative_ttl
+        self.memory = LRUCache(max_entries)
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS lyrics (key TEXT PRIMARY KEY, lyrics TEXT, updated REAL)"
+        )
+
+    def genius(self):
+        # Built on first use, off the event loop.
+        with self._genius_lock:
+            if self._genius is None:
+                self._genius = self.make_genius()
+            return self._genius
+
+    async def warm(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.genius)
+
+    @staticmethod
+    def key_for(title: str) -> str:
+        song, artist = clean_title(title)
+        return f"{artist.lower()}|{song.lower()}"
+
+    def _load(self, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT lyrics, updated FROM lyrics WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        lyrics, updated = row
+        if not lyrics and time.time() - updated > self.negative_ttl:
+            return None
+        return lyrics
+
+    def _store(self, key: str, lyrics: str):
+        self.memory.put(key, lyrics)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO lyrics (key, lyrics, updated) VALUES (?, ?, ?)",
+                (key, lyrics, time.time()),
+            )
+
+    async def get(self, title: str):
+        # Cached misses are stored as "" so a song Genius doesn't know is only looked up once.
+        key = self.key_for(title)
+        lyrics = self.memory.get(key)
+        if lyrics is not None:
+            self.stats["hits"] += 1
+            return lyrics or None
+        lyrics = self._load(key)
+        if lyrics is not None:
+            self.stats["disk_hits"] += 1
+            self.memory.put(key, lyrics)
+            return lyrics or None
+        self.stats["misses"] += 1
+
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._fetch(key, title))
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        lyrics = await asyncio.shield(fut)
+        return lyrics or None
+
+    async def _fetch(self, key: str, title: str) -> str:
+        song, artist = clean_title(title)
+        info = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.genius().search_song(song, artist)
+        )
+        lyrics = info.lyrics.strip() if info and info.lyrics else ""
+        self._store(key, lyrics)
+        return lyrics
+
+    def prefetch(self, title: str):
+        async def warm():
+            try:
+                await self.get(title)
+            except Exception:
+                pass
+
+        if self.key_for(title) not in self.memory:
+            asyncio.ensure_future(warm())
+
+    def close(self):
+        with self._lock:
+            self._db.close()
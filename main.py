@@ -1,15 +1,30 @@
+import time
+PROCESS_START = time.perf_counter()
 import discord
 from discord.ext import commands
 import os
 import asyncio
-import yt_dlp
-import lyricsgenius
 from dotenv import load_dotenv
-import urllib.parse
-import urllib.request
-import re
 import datetime
 import random
+from audiocache import AudioCache
+from cache import MetadataCache
+from extractor import BULK, INTERACTIVE, PRIORITY_NAMES, ExtractionScheduler
+from ingest import BoundedWorkers, stream_entries
+from journal import Journal, unpack_track
+from leases import StreamLeases, stream_failed
+from library import TrackLibrary
+from loudness import BASE_VOLUME_DB, LoudnessAnalyzer
+from lyrics import LyricsService, paginate
+from metrics import FirstPacketProbe, Metrics, StreamCpuProbe, executor_queue_depth
+from nowplaying import CONTROLS, NowPlayingController
+from prefetch import Prefetcher
+from reactions import ReactionRouter
+from resolver import SearchResolver, extract_video_id, is_opus_stream
+from sessions import SessionManager
+from tracks import Track
+from watchdog import LoopWatchdog
+IMPORTS_DONE = time.perf_counter()
 
 def make_progress_bar(elapsed: float, total: float, length: int = 20) -> str:
     filled = int(elapsed / total * length)
@@ -22,9 +37,17 @@ def make_progress_bar(elapsed: float, total: float, length: int = 20) -> str:
 
     return f"{bar} {fmt(elapsed)}/{fmt(total)}"
 
-def run_bot():
-    load_dotenv()
-    DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
+# yt-dlp and lyricsgenius are slow to import, so they're only loaded on first use, from a
+# worker thread, or by the warm-up that runs once the gateway is ready.
+def make_youtube_dl(opts):
+    import yt_dlp
+    return yt_dlp.YoutubeDL(opts)
+
+def make_genius(token):
+    import lyricsgenius
+    return lyricsgenius.Genius(token)
+
+def build_bot():
     GENIUS_TOKEN  = os.getenv("GENIUS_TOKEN")
     ROLE_NAME     = os.getenv("ROLE_NAME")
     RESTRICTED_UID= 123456789012345678
@@ -32,47 +55,363 @@ def run_bot():
     intents = discord.Intents.default()
     intents.message_content = True
     intents.voice_states    = True
-    client = commands.Bot(command_prefix="!", intents=intents)
+    # Reaction controls are routed by message id, so the message cache can stay small or off.
+    client = commands.Bot(
+        command_prefix="!", intents=intents,
+        max_messages=int(os.getenv("MESSAGE_CACHE_SIZE", "0")) or None,
+    )
+    reactions = ReactionRouter()
 
-    queues           = {}
-    voice_clients    = {}
-    current_song     = {}
-    song_start_times = {}
-    loop_status      = {}
-    last_np_message  = {}
+    sessions = SessionManager(idle_timeout=float(os.getenv("SESSION_IDLE_TIMEOUT", "900")))
+    metrics_port = int(os.getenv("METRICS_PORT", "0"))
 
     youtube_base_url    = "https://www.youtube.com/"
-    youtube_results_url = youtube_base_url + "results?"
     youtube_watch_url   = youtube_base_url + "watch?v="
 
+    QUEUE_PAGE_SIZE = 10
+    PLAYLIST_READ_TIMEOUT = 600
+    # Lets a command racing the failed one claim the connection before it's dropped.
+    VOICE_ROLLBACK_DELAY = 5
+
+    passthrough = os.getenv("OPUS_PASSTHROUGH") == "1"
     yt_dl_opts = {
-        "format": "bestaudio/best",
+        "format": "bestaudio[acodec=opus]/bestaudio/best" if passthrough else "bestaudio/best",
         "noplaylist": True,
         "quiet": True,
         "no_warnings": True,
         "extract_flat": "in_playlist",
+        "socket_timeout": 15,
     }
-    ytdl   = yt_dlp.YoutubeDL(yt_dl_opts)
-    genius = lyricsgenius.Genius(GENIUS_TOKEN)
+    extractor = ExtractionScheduler(
+        make_youtube_dl,
+        {"default": yt_dl_opts, "playlist": {**yt_dl_opts, "noplaylist": False}},
+        workers=int(os.getenv("EXTRACT_WORKERS", "4")),
+        timeout=float(os.getenv("EXTRACT_TIMEOUT", "30")),
+        long_workers=int(os.getenv("PLAYLIST_READERS", "2")),
+    )
+    playlist_concurrency = int(os.getenv("PLAYLIST_CONCURRENCY", "4"))
+    metrics = Metrics()
+    # Seconds from process start to the end of each startup phase.
+    startup = {}
+
+    def mark_startup(phase, at=None):
+        startup[phase] = (at or time.perf_counter()) - PROCESS_START
+        metrics.observe("startup_seconds", phase, startup[phase])
+
+    mark_startup("imports", IMPORTS_DONE)
 
+    def startup_report():
+        return " → ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in startup.items())
+    watchdog = LoopWatchdog(
+        threshold=float(os.getenv("LOOP_STALL_THRESHOLD", "0.25")),
+        metrics=metrics,
+        strict=os.getenv("LOOP_WATCHDOG_STRICT") == "1",
+    )
+    metadata = MetadataCache(os.getenv("CACHE_DB", "musicbot.db"))
+    lyrics_service = LyricsService(lambda: make_genius(GENIUS_TOKEN), os.getenv("CACHE_DB", "musicbot.db"))
+    library = TrackLibrary(os.getenv("CACHE_DB", "musicbot.db"))
+    resolver = SearchResolver(extractor.extract, metadata, timeout=float(os.getenv("SEARCH_TIMEOUT", "5")))
+
+    audio_cache_dir = os.getenv("AUDIO_CACHE_DIR")
+    audio_cache = AudioCache(
+        audio_cache_dir,
+        max_bytes=int(os.getenv("AUDIO_CACHE_MAX_MB", "1024")) * 2**20,
+        max_track_seconds=float(os.getenv("AUDIO_CACHE_MAX_TRACK_SECONDS", "900")),
+    ) if audio_cache_dir else None
+
+    loudness = LoudnessAnalyzer(
+        metadata,
+        resolve=lambda video_id: leases.get(youtube_watch_url + video_id, priority=BULK),
+        target=float(os.getenv("LOUDNESS_TARGET", "-14")),
+    ) if os.getenv("LOUDNESS_NORMALIZE", "1") == "1" else None
+    if audio_cache and loudness:
+        # Measure from the local copy once it exists rather than downloading the track again.
+        audio_cache.on_fill.append(loudness.analyze)
+    loudness_tolerance = float(os.getenv("LOUDNESS_TOLERANCE", "2"))
+
+    # Passthrough can't scale samples, so volume is left to each listener's own slider and
+    # transcoded fallbacks play at full volume too, to keep levels consistent.
+    base_volume_db = 0.0 if passthrough else BASE_VOLUME_DB
     ffmpeg_opts = {
         "before_options": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5",
-        "options"       : '-vn -filter:a "volume=0.25"',
+        "options"       : "-vn" if passthrough else '-vn -filter:a "volume=0.25"',
     }
 
+    def track_gain(song):
+        video_id = extract_video_id(song.url) if loudness else None
+        return metadata.get_gain(video_id) if video_id else None
+
+    def make_source(source, offset=0.0, local=False, gain=None):
+        before = "" if local else ffmpeg_opts["before_options"]
+        if offset:
+            before = f"-ss {offset:.1f} {before}"
+        options = ffmpeg_opts["options"]
+        if gain is not None:
+            options = f'-vn -filter:a "volume={base_volume_db + gain:.2f}dB"'
+        # A track that needs real correction is worth transcoding even in passthrough mode.
+        needs_gain = gain is not None and abs(gain) > loudness_tolerance
+        copy = passthrough and not needs_gain and (local or is_opus_stream(source))
+        mode = "copy" if copy else "transcode"
+        with metrics.timer("ffmpeg_spawn"):
+            player = discord.FFmpegOpusAudio(
+                source,
+                codec="copy" if copy else None,
+                before_options=before.strip(),
+                options="-vn" if copy else options,
+            )
+        return StreamCpuProbe(player, lambda cpu: metrics.observe("ffmpeg_cpu_seconds_per_minute", mode, cpu))
+
+    async def resolve_stream(url, guild_id=None, priority=INTERACTIVE):
+        with metrics.timer("stream_resolve"):
+            data = await extractor.extract(url, guild_id=guild_id, priority=priority)
+        return data["url"]
+
+    async def connect_voice(channel):
+        with metrics.timer("voice_connect"):
+            return await channel.connect()
+
+    voice_grace = float(os.getenv("VOICE_GRACE_PERIOD", "60"))
+    connecting = {}
+    lingering = {}
+
+    def needs_voice(session, ctx):
+        # Queueing onto a connected bot works from anywhere; joining needs the author's channel.
+        return (getattr(ctx.author.voice, "channel", None) is None
+                and not session.is_connected() and session.guild_id not in connecting)
+
+    def start_connect(session, ctx):
+        # Started up front so the voice handshake overlaps with search and extraction. The
+        # command now owns the connection, so a pending disconnect must not pull it away.
+        cancel_disconnect(session.guild_id)
+        if session.is_connected():
+            return None
+        task = connecting.get(session.guild_id)
+        if task is None:
+            task = connecting[session.guild_id] = asyncio.ensure_future(connect_voice(ctx.author.voice.channel))
+
+            def forget(done):
+                if connecting.get(session.guild_id) is done:
+                    del connecting[session.guild_id]
+
+            task.add_done_callback(forget)
+        return task
+
+    async def finish_connect(session, task):
+        # False when the session was torn down (!stop, a voice disconnect, the reaper) while
+        # the command was connecting or resolving; the command should then just end.
+        if task is not None:
+            vc = await asyncio.shield(task)
+            if sessions.get(session.guild_id) is not session:
+                await vc.disconnect()
+                return False
+            if not session.is_connected():
+                session.voice_client = vc
+        return sessions.get(session.guild_id) is session
+
+    def drop_connect(session):
+        # A connect still in flight at teardown would otherwise land with nobody to own it.
+        task = connecting.pop(session.guild_id, None)
+        if task is not None:
+            task.add_done_callback(
+                lambda t: t.cancelled() or t.exception() or asyncio.ensure_future(t.result().disconnect())
+            )
+
+    async def release_voice(session, task):
+        # Rollback for a command that failed after it started connecting.
+        try:
+            if not await finish_connect(session, task):
+                return
+        except (discord.ClientException, asyncio.TimeoutError):
+            return
+        if not session.is_connected() or session.is_playing() or session.queue:
+            return
+        if session.started_at is None:
+            # Joined for this command and never played anything: leave without a word.
+            schedule_disconnect(session, VOICE_ROLLBACK_DELAY, quiet=True)
+        else:
+            schedule_disconnect(session)
+
+    def schedule_disconnect(session, delay=None, quiet=False):
+        cancel_disconnect(session.guild_id)
+        lingering[session.guild_id] = asyncio.ensure_future(
+            disconnect_later(session, voice_grace if delay is None else delay, quiet)
+        )
+
+    def cancel_disconnect(guild_id):
+        task = lingering.pop(guild_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def disconnect_later(session, delay, quiet=False):
+        await asyncio.sleep(delay)
+        if lingering.get(session.guild_id) is asyncio.current_task():
+            del lingering[session.guild_id]
+        if sessions.get(session.guild_id) is session and not session.is_playing() and not session.queue:
+            await hang_up(session, quiet)
+
+    def voice_error(ctx, description="Couldn't join your voice channel."):
+        return ctx.send(embed=discord.Embed(title="Error", description=description, color=discord.Color.red()))
+
+    def not_in_voice(ctx):
+        return voice_error(ctx, "Join a voice channel first.")
+
+    leases = StreamLeases(resolve_stream)
+
+    async def prefetch_stream(url, guild_id, priority):
+        stream_url = await leases.get(url, guild_id, priority)
+        song = prefetcher.song_for(guild_id)
+        if audio_cache and song is not None and song.url == url:
+            audio_cache.fill(extract_video_id(url), stream_url, song.duration)
+        return stream_url
+
+    prefetch_warm_lead = float(os.getenv("PREFETCH_WARM_LEAD", "10"))
+    prefetcher = Prefetcher(
+        prefetch_stream,
+        (lambda url, song: make_source(url, gain=track_gain(song))) if os.getenv("PREFETCH_WARM") == "1" else None,
+    )
+
+    sessions.on_teardown.append(lambda session: prefetcher.cancel(session.guild_id))
+    sessions.on_teardown.append(lambda session: cancel_disconnect(session.guild_id))
+    sessions.on_teardown.append(drop_connect)
+
+    journal = Journal(os.getenv("JOURNAL_PATH", "musicbot.journal"))
+    pending_restore = journal.replay()
+    journal.open()
+    sessions.on_teardown.append(lambda session: journal.end(session.guild_id))
+
+    def now_playing_embed(session, progress=False):
+        song = session.current
+        embed = discord.Embed(title="Now Playing", color=discord.Color.green())
+        embed.add_field(name="Title", value=f"[{song.title}]({song.url})", inline=False)
+        embed.add_field(name="Duration", value=str(datetime.timedelta(seconds=song.duration)), inline=False)
+        embed.add_field(name="Requested by", value=song.user, inline=False)
+        if progress and song.duration:
+            elapsed = (datetime.datetime.now() - session.started_at).total_seconds()
+            embed.add_field(name="Progress", value=make_progress_bar(min(elapsed, song.duration), song.duration), inline=False)
+        embed.set_thumbnail(url=song.thumbnail)
+        return embed
+
+    async def handle_control(session, payload):
+        emoji = str(payload.emoji)
+        if emoji not in CONTROLS or session.channel is None:
+            return
+        vc = session.voice_client
+        if vc:
+            if emoji == "⏸️":
+                vc.pause()
+                await session.channel.send("⏸️ Paused playback.")
+            elif emoji == "▶️":
+                vc.resume()
+                await session.channel.send("▶️ Resumed playback.")
+            else:
+                vc.stop()
+                await session.channel.send("➡️ Skipped current song.")
+        try:
+            await session.channel.get_partial_message(payload.message_id).remove_reaction(
+                payload.emoji, discord.Object(id=payload.user_id)
+            )
+        except (discord.Forbidden, discord.NotFound):
+            pass
+
+    now_playing = NowPlayingController(
+        now_playing_embed, metrics=metrics, reactions=reactions, on_control=handle_control
+    )
+    sessions.on_teardown.append(now_playing.forget)
+
+    def refresh_prefetch(session):
+        q = session.queue
+        song = session.current
+        start = session.started_at
+        if not q or not song or not start:
+            return prefetcher.cancel(session.guild_id)
+        elapsed = (datetime.datetime.now() - start).total_seconds()
+        prefetcher.schedule(session.guild_id, q[0], warm_in=max(0.0, song.duration - elapsed - prefetch_warm_lead))
+
+    def warm_stream(session, song):
+        video_id = extract_video_id(song.url)
+        if audio_cache and video_id in audio_cache:
+            return
+        task = asyncio.ensure_future(leases.get(song.url, session.guild_id))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def report_failure(future):
+        # Errors in playback transitions would otherwise vanish with their future.
+        if not future.cancelled() and future.exception() is not None:
+            client.loop.call_exception_handler({
+                "message": "Playback transition failed", "exception": future.exception(), "future": future,
+            })
+
+    def session_for(ctx):
+        session = sessions.get_or_create(ctx.guild.id)
+        session.channel = ctx.channel
+        return session
+
+    @client.event
+    async def setup_hook():
+        mark_startup("login")
+        watchdog.start()
+        resolver.attach(client.http.connector)
+        sessions.start_reaper()
+        journal.start_compactor(sessions, interval=float(os.getenv("JOURNAL_COMPACT_INTERVAL", "300")))
+        metrics.gauge("voice_sessions_active", lambda: sum(s.is_connected() for s in sessions))
+        metrics.gauge("guild_sessions", lambda: len(sessions))
+        metrics.gauge("executor_queue_depth", lambda: executor_queue_depth(client.loop))
+        metrics.gauge("extract_running", lambda: extractor.running)
+        if audio_cache:
+            metrics.gauge("audio_cache_bytes", lambda: audio_cache.size)
+            metrics.gauge("audio_cache_hit_ratio", audio_cache.hit_rate)
+        for name in PRIORITY_NAMES:
+            metrics.gauge(f"extract_queue_{name}", lambda name=name: extractor.depth()[name])
+        # Counted from what the bot spawns itself, so a scrape doesn't have to walk /proc.
+        metrics.gauge("ffmpeg_processes", lambda: len(StreamCpuProbe.active)
+                      + (audio_cache.running if audio_cache else 0)
+                      + (loudness.running if loudness else 0))
+        if metrics_port:
+            await metrics.serve(os.getenv("METRICS_HOST", "127.0.0.1"), metrics_port)
+
     @client.event
     async def on_ready():
         print(f"{client.user} is now jamming")
+        if "ready" not in startup:
+            mark_startup("ready")
+            asyncio.ensure_future(warm_up())
+        if pending_restore:
+            await restore_sessions()
+
+    async def warm_up():
+        await asyncio.gather(extractor.warm(), lyrics_service.warm(), return_exceptions=True)
+        mark_startup("warm")
+        print("startup: " + startup_report())
+
+    async def restore_sessions():
+        states = dict(pending_restore)
+        pending_restore.clear()
+        for gid, state in states.items():
+            guild = client.get_guild(gid)
+            if guild is None:
+                continue
+            session = sessions.get_or_create(gid)
+            session.channel = guild.get_channel(state.channel_id) if state.channel_id else None
+            session.queue.extend(unpack_track(t) for t in state.queue)
+            voice = guild.get_channel(state.voice_id) if state.voice_id else None
+            if state.current is None or session.channel is None or voice is None:
+                continue
+            try:
+                session.voice_client = await connect_voice(voice)
+            except (discord.ClientException, asyncio.TimeoutError):
+                continue
+            song = unpack_track(state.current)
+            offset = max(time.time() - state.started, 0.0)
+            if song.duration and offset >= song.duration:
+                asyncio.ensure_future(handle_queue(session))
+            else:
+                asyncio.ensure_future(play_song(session, song, offset=offset))
+        await journal.compact(sessions)
 
     @client.event
     async def on_voice_state_update(member, before, after):
         if member == client.user and before.channel and not after.channel:
-            gid = before.channel.guild.id
-            vc = voice_clients.pop(gid, None)
-            if vc:
-                vc.stop()
-            current_song.pop(gid, None)
-            song_start_times.pop(gid, None)
+            sessions.teardown(before.channel.guild.id)
 
     @client.event
     async def on_command_error(ctx, error):
@@ -82,110 +421,139 @@ def run_bot():
                 description="🚫 You need the **DJ** role to use that command.",
                 color=discord.Color.red()
             ))
+        elif isinstance(error, commands.MissingPermissions):
+            await ctx.send(embed=discord.Embed(
+                title="Access Denied",
+                description="🚫 Only server administrators can use that command.",
+                color=discord.Color.red()
+            ))
         else:
             raise error
 
     @client.event
-    async def on_reaction_add(reaction: discord.Reaction, user: discord.User):
-        if user.bot:
-            return
-
-        msg = reaction.message
-        if msg.author != client.user or not msg.embeds:
-            return
-        embed = msg.embeds[0]
-        if embed.title != "Now Playing" or reaction.emoji not in ("⏸️","▶️","➡️"):
-            return
-
-        gid = msg.guild.id
-        vc  = voice_clients.get(gid)
-        if not vc:
-            try:
-                await msg.remove_reaction(reaction.emoji, user)
-            except (discord.Forbidden, discord.NotFound):
-                pass
+    async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
+        if payload.user_id == client.user.id or (payload.member and payload.member.bot):
             return
+        await reactions.dispatch(payload)
 
-        if reaction.emoji == "⏸️":
-            vc.pause()
-            await msg.channel.send("⏸️ Paused playback.")
-        elif reaction.emoji == "▶️":
-            vc.resume()
-            await msg.channel.send("▶️ Resumed playback.")
-        else:
-            vc.stop()
-            await msg.channel.send("➡️ Skipped current song.")
+    async def play_song(session, song, stream_url=None, offset=0.0, requested_at=None, trigger="command",
+                        retried=False):
+        cancel_disconnect(session.guild_id)
+        player = None
+        video_id = extract_video_id(song.url)
+        cached = audio_cache.lookup(video_id) if audio_cache and video_id else None
+        if cached:
+            prefetcher.discard(session.guild_id, song)
+        elif not stream_url:
+            stream_url, player = await prefetcher.take(session.guild_id, song)
+            if stream_url and not leases.fresh(stream_url):
+                # Prefetched long ago (e.g. a paused queue); the URL is about to expire.
+                if player is not None:
+                    player.cleanup()
+                stream_url = player = None
+        if not cached and not stream_url:
             try:
-                await msg.delete()
-            except (discord.Forbidden, discord.NotFound):
-                pass
-            return
-
-        try:
-            await msg.remove_reaction(reaction.emoji, user)
-        except (discord.Forbidden, discord.NotFound):
-            pass
+                stream_url = await leases.get(song.url, session.guild_id)
+            except Exception:
+                await session.channel.send(embed=discord.Embed(
+                    title="Error",
+                    description="There was an error extracting video information.",
+                    color=discord.Color.red()
+                ))
+                return False
+        if sessions.get(session.guild_id) is not session or not session.is_connected():
+            # Torn down (!stop, a voice disconnect, the reaper) while the stream was resolving.
+            if player is not None:
+                player.cleanup()
+            return False
+        if session.is_playing():
+            # Another command or queue transition got there first; keep our place at the front.
+            if player is not None:
+                player.cleanup()
+            session.queue.append(song)
+            journal.push(session.guild_id, song)
+            session.queue.move(len(session.queue) - 1, 0)
+            journal.move(session.guild_id, len(session.queue) - 1, 0)
+            return False
 
-    async def play_song(ctx, song):
-        try:
-            data = await asyncio.get_event_loop().run_in_executor(
-                None, lambda: ytdl.extract_info(song["url"], download=False)
-            )
-        except Exception:
-            return await ctx.send(embed=discord.Embed(
-                title="Error",
-                description="There was an error extracting video information.",
-                color=discord.Color.red()
+        filling = audio_cache.fill(video_id, stream_url, song.duration) if audio_cache and not cached else False
+        if loudness and not filling:
+            # A running fill analyses the local copy when it lands; anything else is measured now.
+            loudness.analyze(video_id, cached)
+        if cached:
+            player = make_source(cached, offset, local=True, gain=track_gain(song))
+        elif player is None:
+            player = make_source(stream_url, offset, gain=track_gain(song))
+        if requested_at is not None:
+            player = FirstPacketProbe(player, lambda: metrics.observe(
+                "time_to_first_audio_seconds", trigger, time.perf_counter() - requested_at
             ))
 
-        player = discord.FFmpegOpusAudio(data["url"], **ffmpeg_opts)
+        source = player
 
         def after_play(err):
-            vc = voice_clients.get(ctx.guild.id)
-            if not vc or not vc.is_connected():
+            if sessions.get(session.guild_id) is not session or not session.is_connected():
                 return
-            next_coro = (
-                play_song(ctx, song)
-                if loop_status.get(ctx.guild.id)
-                else handle_queue(ctx)
-            )
-            asyncio.run_coroutine_threadsafe(next_coro, client.loop)
+            ended_at = time.perf_counter()
+            if (err is not None or stream_failed(source)) and not retried:
+                # The stream died under us, most likely an expired or revoked URL: get a fresh
+                # one and pick up where playback stopped.
+                leases.invalidate(song.url)
+                elapsed = (datetime.datetime.now() - session.started_at).total_seconds()
+                next_coro = play_song(session, song, offset=elapsed, requested_at=ended_at,
+                                      trigger="retry", retried=True)
+            elif session.loop:
+                next_coro = play_song(session, song, requested_at=ended_at, trigger="loop")
+            else:
+                next_coro = handle_queue(session, ended_at)
+            asyncio.run_coroutine_threadsafe(next_coro, client.loop).add_done_callback(report_failure)
 
-        voice_clients[ctx.guild.id].play(player, after=after_play)
-        current_song[ctx.guild.id]     = song
-        song_start_times[ctx.guild.id] = datetime.datetime.now()
+        session.voice_client.play(player, after=after_play)
+        session.current    = song
+        session.started_at = datetime.datetime.now() - datetime.timedelta(seconds=offset)
+        session.touch()
+        journal.playing(
+            session.guild_id, song, session.started_at.timestamp(),
+            session.channel.id, session.voice_client.channel.id,
+        )
+        refresh_prefetch(session)
+        lyrics_service.prefetch(song.title)
+        if trigger in ("command", "queue"):
+            library.record(session.guild_id, video_id, song.title)
+        now_playing.update(session)
+        return True
 
-        prev = last_np_message.get(ctx.guild.id)
-        if prev:
-            try:
-                old = await ctx.fetch_message(prev)
-                await old.delete()
-            except:
-                pass
+    async def play_next(session, requested_at=None, trigger="queue"):
+        # Starts the next queued track unless one is already playing. Entries that can't be
+        # played (private or deleted videos) are skipped instead of stalling the queue.
+        q = session.queue
+        while q and sessions.get(session.guild_id) is session and session.is_connected() and not session.is_playing():
+            next_song = q.popleft()
+            journal.pop(session.guild_id)
+            if await play_song(session, next_song, requested_at=requested_at, trigger=trigger):
+                return
 
-        embed = discord.Embed(title="Now Playing", color=discord.Color.green())
-        embed.add_field(name="Title", value=f"[{song['title']}]({song['url']})", inline=False)
-        embed.add_field(name="Duration", value=str(datetime.timedelta(seconds=song["duration"])), inline=False)
-        embed.add_field(name="Requested by", value=song["user"], inline=False)
-        embed.set_thumbnail(url=song["thumbnail"])
-        msg = await ctx.send(embed=embed)
-        for emoji in ("⏸️","▶️","➡️"):
-            await msg.add_reaction(emoji)
-        last_np_message[ctx.guild.id] = msg.id
-
-    async def handle_queue(ctx):
-        q = queues.get(ctx.guild.id)
-        if q:
-            next_song = q.pop(0)
-            await play_song(ctx, next_song)
-        else:
-            await disconnect_bot(ctx)
+    async def handle_queue(session, requested_at=None):
+        await play_next(session, requested_at)
+        if sessions.get(session.guild_id) is session and not session.is_playing() and not session.queue:
+            await disconnect_bot(session)
+
+    async def disconnect_bot(session):
+        if voice_grace > 0 and session.is_connected():
+            # Stay in the channel for a while so a follow-up !play doesn't have to reconnect.
+            session.current = None
+            journal.end(session.guild_id)
+            return schedule_disconnect(session)
+        await hang_up(session)
 
-    async def disconnect_bot(ctx):
-        vc = voice_clients.pop(ctx.guild.id, None)
+    async def hang_up(session, quiet=False):
+        vc = session.voice_client
+        sessions.teardown(session.guild_id)
         if vc:
             await vc.disconnect()
-        await ctx.send(embed=discord.Embed(
+        if quiet:
+            return
+        await session.channel.send(embed=discord.Embed(
             title="Disconnected",
             description="Queue is empty. Bot disconnected.",
             color=discord.Color.red()
@@ -193,6 +561,7 @@ def run_bot():
 
     @client.before_invoke
     async def pre_command_cleanup_and_check(ctx):
+        ctx.invoked_at = time.perf_counter()
         try:
             await ctx.message.delete()
         except:
@@ -206,65 +575,103 @@ def run_bot():
             ))
             raise commands.CheckFailure()
 
+    @client.after_invoke
+    async def record_command_latency(ctx):
+        started = getattr(ctx, "invoked_at", None)
+        if started is not None:
+            metrics.observe("command_seconds", ctx.command.qualified_name, time.perf_counter() - started)
+
     @client.command(name="play", aliases=["p"])
     @commands.has_role(ROLE_NAME)
     async def play(ctx, *, link=None, user=None):
-        queues.setdefault(ctx.guild.id, [])
+        session = session_for(ctx)
         if not link:
-            q = queues[ctx.guild.id]
+            q = session.queue
             if q:
-                vc = voice_clients.get(ctx.guild.id)
-                if vc and vc.is_connected() and not vc.is_playing():
-                    song = q.pop(0)
-                    return await play_song(ctx, song)
-                vc = await ctx.author.voice.channel.connect()
-                voice_clients[ctx.guild.id] = vc
-                song = q.pop(0)
-                return await play_song(ctx, song)
+                if needs_voice(session, ctx):
+                    return await not_in_voice(ctx)
+                try:
+                    if not await finish_connect(session, start_connect(session, ctx)):
+                        return
+                except (discord.ClientException, asyncio.TimeoutError):
+                    return await voice_error(ctx)
+                if not session.is_playing():
+                    journal.pop(session.guild_id)
+                    return await play_song(session, q.popleft(), requested_at=getattr(ctx, "invoked_at", None))
+                return
             return await ctx.send(embed=discord.Embed(
                 title="Queue", description="Queue is empty.", color=discord.Color.red()
             ))
+        if needs_voice(session, ctx):
+            return await not_in_voice(ctx)
+        connect_task = start_connect(session, ctx)
         if "youtube.com" not in link:
-            query = urllib.parse.urlencode({"search_query": link})
-            html  = urllib.request.urlopen(youtube_results_url + query).read().decode()
-            m     = re.search(r"/watch\?v=(.{11})", html)
-            if m:
-                link = youtube_watch_url + m.group(1)
+            with metrics.timer("library"):
+                video_id = library.match(link)
+            if not video_id:
+                with metrics.timer("search"):
+                    video_id = await resolver.resolve(link)
+            if video_id:
+                link = youtube_watch_url + video_id
+        video_id = extract_video_id(link)
+        info = metadata.get_track(video_id) if video_id else None
+        stream_url = None
+        if info is None:
+            try:
+                with metrics.timer("extract"):
+                    info = await extractor.extract(link, guild_id=session.guild_id)
+            except Exception:
+                await release_voice(session, connect_task)
+                return await ctx.send(embed=discord.Embed(
+                    title="Error", description="Error extracting video info.", color=discord.Color.red()
+                ))
+            stream_url = info.get("url")
+            if stream_url:
+                leases.put(link, stream_url)
+            metadata.put_track(info.get("id") or video_id, info)
+        song = Track(
+            info["title"],
+            link,
+            info.get("duration") or 0,
+            info.get("thumbnail"),
+            user or ctx.author.display_name,
+        )
+        if connect_task is not None and not connect_task.done() and stream_url is None:
+            # Metadata came from the cache; resolve the stream while voice finishes connecting.
+            warm_stream(session, song)
         try:
-            data = await asyncio.get_event_loop().run_in_executor(
-                None, lambda: ytdl.extract_info(link, download=False)
-            )
-        except Exception:
+            if not await finish_connect(session, connect_task):
+                return
+        except (discord.ClientException, asyncio.TimeoutError):
+            return await voice_error(ctx)
+        if session.is_playing():
+            session.queue.append(song)
+            journal.push(session.guild_id, song)
+            refresh_prefetch(session)
             return await ctx.send(embed=discord.Embed(
-                title="Error", description="Error extracting video info.", color=discord.Color.red()
+                title="Added to Queue",
+                description=f"{song.title} at position {len(session.queue)}.",
+                color=discord.Color.blue()
             ))
-        song = {
-            "title": data["title"],
-            "url": link,
-            "duration": data["duration"],
-            "thumbnail": data["thumbnail"],
-            "user": user or ctx.author.display_name,
-        }
-        vc = voice_clients.get(ctx.guild.id)
-        if vc and vc.is_connected():
-            if vc.is_playing():
-                queues[ctx.guild.id].append(song)
-                return await ctx.send(embed=discord.Embed(
-                    title="Added to Queue",
-                    description=f"{song['title']} at position {len(queues[ctx.guild.id])}.",
-                    color=discord.Color.blue()
-                ))
-            return await play_song(ctx, song)
-        vc = await ctx.author.voice.channel.connect()
-        voice_clients[ctx.guild.id] = vc
-        await play_song(ctx, song)
+        await play_song(session, song, stream_url, requested_at=getattr(ctx, "invoked_at", None))
 
     @client.command(name="search")
     @commands.has_role(ROLE_NAME)
     async def search(ctx, *, keywords):
-        data = ytdl.extract_info(f"ytsearch5:{keywords}", download=False)
-        entries = data.get("entries", [])
+        session = session_for(ctx)
+        if needs_voice(session, ctx):
+            return await not_in_voice(ctx)
+        connect_task = start_connect(session, ctx)
+        try:
+            with metrics.timer("search"):
+                entries = await resolver.search(keywords, limit=5, guild_id=ctx.guild.id)
+        except Exception:
+            await release_voice(session, connect_task)
+            return await ctx.send(embed=discord.Embed(
+                title="Error", description="Error searching YouTube.", color=discord.Color.red()
+            ))
         if not entries:
+            await release_voice(session, connect_task)
             return await ctx.send("No results found.")
 
         lines = [
@@ -279,60 +686,69 @@ def run_bot():
         msg = await ctx.send(embed=em)
 
         emojis = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣"]
-        for i in range(len(entries)):
-            await msg.add_reaction(emojis[i])
-
-        def check(r, u):
-            return (
-                    u == ctx.author
-                    and r.message.id == msg.id
-                    and r.emoji in emojis[:len(entries)]
-            )
 
+        def check(payload):
+            return payload.user_id == ctx.author.id and str(payload.emoji) in emojis[:len(entries)]
+
+        # Listen before adding the options so a quick pick isn't missed.
+        selection = reactions.expect(msg.id, check)
         try:
-            reaction, user = await client.wait_for(
-                "reaction_add", timeout=30.0, check=check
-            )
+            for i in range(len(entries)):
+                await msg.add_reaction(emojis[i])
+            payload = await asyncio.wait_for(selection, timeout=30.0)
         except asyncio.TimeoutError:
+            await release_voice(session, connect_task)
             return await ctx.send("❌ Selection timed out.")
+        finally:
+            selection.cancel()
 
         try:
             await msg.delete()
         except:
             pass
 
-        idx = emojis.index(reaction.emoji)
+        picked_at = time.perf_counter()
+        idx = emojis.index(str(payload.emoji))
         pick = entries[idx]
         pick_url = pick.get("webpage_url") or pick.get("url") or (
                 youtube_watch_url + pick.get("id", "")
         )
-        song = {
-            "title": pick.get("title", "Unknown"),
-            "url": pick_url,
-            "duration": pick.get("duration", 0),
-            "thumbnail": pick.get("thumbnail"),
-            "user": ctx.author.display_name,
-        }
-
-        gid = ctx.guild.id
-        vc = voice_clients.get(gid)
-        q = queues.setdefault(gid, [])
-        if vc and vc.is_connected() and vc.is_playing():
+        song = Track(
+            pick.get("title", "Unknown"),
+            pick_url,
+            int(pick.get("duration") or 0),
+            pick.get("thumbnail"),
+            ctx.author.display_name,
+        )
+
+        q = session.queue
+        if session.is_playing():
             q.append(song)
-            return await ctx.send(f"✅ Queued **{song['title']}** at position {len(q)}.")
-        vc = await ctx.author.voice.channel.connect()
-        voice_clients[gid] = vc
-        await play_song(ctx, song)
+            journal.push(session.guild_id, song)
+            refresh_prefetch(session)
+            return await ctx.send(f"✅ Queued **{song.title}** at position {len(q)}.")
+        if connect_task is not None and not connect_task.done():
+            warm_stream(session, song)
+        try:
+            if not await finish_connect(session, connect_task):
+                return
+        except (discord.ClientException, asyncio.TimeoutError):
+            return await voice_error(ctx)
+        await play_song(session, song, requested_at=picked_at)
 
     @client.command(name="shuffle")
     @commands.has_role(ROLE_NAME)
     async def shuffle_cmd(ctx):
-        q = queues.get(ctx.guild.id)
+        session = sessions.get(ctx.guild.id)
+        q = session.queue if session else None
         if not q:
             return await ctx.send(embed=discord.Embed(
                 title="Error", description="Queue is empty.", color=discord.Color.red()
             ))
-        random.shuffle(q)
+        seed = random.getrandbits(64)
+        q.shuffle(seed)
+        journal.shuffle(session.guild_id, seed)
+        refresh_prefetch(session)
         await ctx.send(embed=discord.Embed(
             title="🔀 Shuffled", description="Queue randomized!", color=discord.Color.purple()
         ))
@@ -340,8 +756,11 @@ def run_bot():
     @client.command(name="clear")
     @commands.has_role(ROLE_NAME)
     async def clear(ctx):
-        if queues.get(ctx.guild.id):
-            queues[ctx.guild.id].clear()
+        session = sessions.get(ctx.guild.id)
+        if session and session.queue:
+            session.queue.clear()
+            journal.clear(session.guild_id)
+            prefetcher.cancel(ctx.guild.id)
             return await ctx.send(embed=discord.Embed(
                 title="Queue Cleared", description="Queue cleared!", color=discord.Color.orange()
             ))
@@ -352,7 +771,8 @@ def run_bot():
     @client.command(name="remove")
     @commands.has_role(ROLE_NAME)
     async def remove(ctx, position: int):
-        q = queues.get(ctx.guild.id)
+        session = sessions.get(ctx.guild.id)
+        q = session.queue if session else None
         if not q:
             return await ctx.send(embed=discord.Embed(
                 title="Error", description="Queue is empty.", color=discord.Color.red()
@@ -361,16 +781,40 @@ def run_bot():
             return await ctx.send(embed=discord.Embed(
                 title="Error", description=f"Position must be 1–{len(q)}.", color=discord.Color.red()
             ))
-        song = q.pop(position - 1)
+        song = q.remove_at(position - 1)
+        journal.remove(session.guild_id, position - 1)
+        refresh_prefetch(session)
         await ctx.send(embed=discord.Embed(
-            title="Removed", description=f"Removed **{song['title']}** from position {position}.",
+            title="Removed", description=f"Removed **{song.title}** from position {position}.",
+            color=discord.Color.green()
+        ))
+
+    @client.command(name="move")
+    @commands.has_role(ROLE_NAME)
+    async def move(ctx, src: int, dst: int):
+        session = sessions.get(ctx.guild.id)
+        q = session.queue if session else None
+        if not q:
+            return await ctx.send(embed=discord.Embed(
+                title="Error", description="Queue is empty.", color=discord.Color.red()
+            ))
+        if not (1 <= src <= len(q) and 1 <= dst <= len(q)):
+            return await ctx.send(embed=discord.Embed(
+                title="Error", description=f"Positions must be 1–{len(q)}.", color=discord.Color.red()
+            ))
+        song = q.move(src - 1, dst - 1)
+        journal.move(session.guild_id, src - 1, dst - 1)
+        refresh_prefetch(session)
+        await ctx.send(embed=discord.Embed(
+            title="Moved", description=f"Moved **{song.title}** to position {dst}.",
             color=discord.Color.green()
         ))
 
     @client.command(name="pause")
     @commands.has_role(ROLE_NAME)
     async def pause(ctx):
-        vc = voice_clients.get(ctx.guild.id)
+        session = sessions.get(ctx.guild.id)
+        vc = session.voice_client if session else None
         if vc:
             vc.pause()
             await ctx.send(embed=discord.Embed(
@@ -380,7 +824,8 @@ def run_bot():
     @client.command(name="resume")
     @commands.has_role(ROLE_NAME)
     async def resume(ctx):
-        vc = voice_clients.get(ctx.guild.id)
+        session = sessions.get(ctx.guild.id)
+        vc = session.voice_client if session else None
         if vc:
             vc.resume()
             await ctx.send(embed=discord.Embed(
@@ -390,11 +835,13 @@ def run_bot():
     @client.command(name="stop", aliases=["fuckoff"])
     @commands.has_role(ROLE_NAME)
     async def stop(ctx):
-        vc = voice_clients.pop(ctx.guild.id, None)
+        # teardown() clears the session's voice client, so take it first. A client a command
+        # connected but hasn't attached yet is only reachable via the guild.
+        session = sessions.get(ctx.guild.id)
+        vc = (session.voice_client if session else None) or ctx.guild.voice_client
+        sessions.teardown(ctx.guild.id)
         if vc:
-            vc.stop()
             await vc.disconnect()
-        current_song.pop(ctx.guild.id, None)
         await ctx.send(embed=discord.Embed(
             title="Stopped", description="Playback stopped and bot disconnected.", color=discord.Color.red()
         ))
@@ -402,9 +849,9 @@ def run_bot():
     @client.command(name="skip", aliases=["s"])
     @commands.has_role(ROLE_NAME)
     async def skip(ctx):
-        vc = voice_clients.get(ctx.guild.id)
-        if vc and vc.is_playing():
-            vc.stop()
+        session = sessions.get(ctx.guild.id)
+        if session and session.is_playing():
+            session.voice_client.stop()
             await ctx.send(embed=discord.Embed(
                 title="Skipped", description="Skipped current song.", color=discord.Color.orange()
             ))
@@ -416,13 +863,16 @@ def run_bot():
 
     @client.command(name="queue", aliases=["q"])
     @commands.has_role(ROLE_NAME)
-    async def queue_cmd(ctx):
-        q = queues.get(ctx.guild.id)
+    async def queue_cmd(ctx, page: int = 1):
+        session = sessions.get(ctx.guild.id)
+        q = session.queue if session else None
         if q:
-            msg = "\n".join(f"{i}. {song['title']}" for i, song in enumerate(q, start=1))
-            await ctx.send(embed=discord.Embed(
-                title="Current Queue", description=msg, color=discord.Color.blue()
-            ))
+            pages = q.page_count(QUEUE_PAGE_SIZE)
+            page = min(max(page, 1), pages)
+            msg = "\n".join(f"{i}. {song.title}" for i, song in q.page(page, QUEUE_PAGE_SIZE))
+            embed = discord.Embed(title="Current Queue", description=msg, color=discord.Color.blue())
+            embed.set_footer(text=f"Page {page}/{pages} · {len(q)} songs")
+            await ctx.send(embed=embed)
         else:
             await ctx.send(embed=discord.Embed(
                 title="Queue", description="Queue is empty!", color=discord.Color.red()
@@ -431,58 +881,45 @@ def run_bot():
     @client.command(name="np")
     @commands.has_role(ROLE_NAME)
     async def np(ctx):
-        song = current_song.get(ctx.guild.id)
-        start = song_start_times.get(ctx.guild.id)
+        session = sessions.get(ctx.guild.id)
+        song = session.current if session else None
+        start = session.started_at if session else None
         if not song or not start:
             return await ctx.send(embed=discord.Embed(
                 title="Now Playing",
                 description="No song is currently playing.",
                 color=discord.Color.red()
             ))
-
-        total = song["duration"]
-        elapsed = (datetime.datetime.now() - start).total_seconds()
-        if elapsed > total:
-            elapsed = total
-
-        prev = last_np_message.get(ctx.guild.id)
-        if prev:
-            try:
-                old = await ctx.fetch_message(prev)
-                await old.delete()
-            except:
-                pass
-
-        embed = discord.Embed(title="Now Playing", color=discord.Color.green())
-        embed.add_field(name="Title", value=f"[{song['title']}]({song['url']})", inline=False)
-        embed.add_field(name="Duration", value=str(datetime.timedelta(seconds=total)), inline=False)
-        embed.add_field(name="Requested by", value=song["user"], inline=False)
-        embed.add_field(name="Progress", value=make_progress_bar(elapsed, total), inline=False)
-        embed.set_thumbnail(url=song["thumbnail"])
-        msg = await ctx.send(embed=embed)
-        for emoji in ("⏸️", "▶️", "➡️"):
-            await msg.add_reaction(emoji)
-
-        last_np_message[ctx.guild.id] = msg.id
+        await now_playing.show(session, progress=True)
 
     @client.command(name="lyrics")
     @commands.has_role(ROLE_NAME)
-    async def lyrics(ctx):
-        song = current_song.get(ctx.guild.id)
+    async def lyrics(ctx, page: int = 1):
+        session = sessions.get(ctx.guild.id)
+        song = session.current if session else None
         if not song:
             return await ctx.send(embed=discord.Embed(
                 title="Error", description="No song is currently playing.", color=discord.Color.red()
             ))
-        info = genius.search_song(song["title"])
-        if not info:
+        try:
+            text = await lyrics_service.get(song.title)
+        except Exception:
+            text = None
+        # Whitespace-only lyrics (e.g. cached before they were stripped) paginate to nothing.
+        pages = paginate(text) if text else []
+        if not pages:
             return await ctx.send(embed=discord.Embed(
                 title="Error", description="Lyrics not found.", color=discord.Color.red()
             ))
-        await ctx.send(embed=discord.Embed(
-            title=f"Lyrics for {song['title']}",
-            description=info.lyrics[:2048],
+        page = min(max(page, 1), len(pages))
+        embed = discord.Embed(
+            title=f"Lyrics for {song.title}",
+            description=pages[page - 1],
             color=discord.Color.blue()
-        ))
+        )
+        if len(pages) > 1:
+            embed.set_footer(text=f"Page {page}/{len(pages)} · !lyrics <page> for more")
+        await ctx.send(embed=embed)
 
     @client.command(name="playlist")
     @commands.has_role(ROLE_NAME)
@@ -491,11 +928,227 @@ def run_bot():
             return await ctx.send(embed=discord.Embed(
                 title="Error", description="Invalid playlist URL provided.", color=discord.Color.red()
             ))
-        data = await asyncio.get_event_loop().run_in_executor(
-            None, lambda: ytdl.extract_info(playlist_url, download=False)
+        session = session_for(ctx)
+        q = session.queue
+        if needs_voice(session, ctx):
+            return await not_in_voice(ctx)
+        connect_task = start_connect(session, ctx)
+        progress = await ctx.send(embed=playlist_progress_embed(0, 0, done=False))
+        fillers = BoundedWorkers(playlist_concurrency)
+        added = 0
+        last_edit = asyncio.get_event_loop().time()
+
+        async def fill(song, video_id):
+            info = await extractor.extract(song.url, guild_id=session.guild_id, priority=BULK)
+            metadata.put_track(video_id, info)
+            song.title = info["title"]
+            song.duration = info.get("duration") or 0
+            song.thumbnail = info.get("thumbnail")
+
+        try:
+            async for entry in stream_entries(
+                lambda pump: extractor.run_long(pump, profile="playlist", timeout=PLAYLIST_READ_TIMEOUT),
+                playlist_url,
+            ):
+                if sessions.get(session.guild_id) is not session:
+                    break
+                video_id = entry.get("id")
+                if not video_id:
+                    continue
+                if entry.get("title"):
+                    metadata.put_track(video_id, entry)
+                info = metadata.get_track(video_id) or {}
+                song = Track(
+                    info.get("title") or youtube_watch_url + video_id,
+                    youtube_watch_url + video_id,
+                    info.get("duration") or 0,
+                    info.get("thumbnail"),
+                    ctx.author.display_name,
+                )
+                if not info.get("title") or not info.get("duration"):
+                    fillers.submit(lambda song=song, video_id=video_id: fill(song, video_id))
+                added += 1
+
+                q.append(song)
+                journal.push(session.guild_id, song)
+                if not session.is_playing():
+                    # Re-checked for every entry, so a first track that can't be played
+                    # doesn't leave the rest of the playlist sitting in a silent queue.
+                    if connect_task is not None and not connect_task.done():
+                        warm_stream(session, song)
+                    try:
+                        if not await finish_connect(session, connect_task):
+                            break
+                    except (discord.ClientException, asyncio.TimeoutError):
+                        fillers.cancel()
+                        await progress.delete()
+                        return await voice_error(ctx)
+                    await play_next(session, getattr(ctx, "invoked_at", None), trigger="command")
+                elif len(q) == 1:
+                    refresh_prefetch(session)
+
+                now = asyncio.get_event_loop().time()
+                if now - last_edit >= 2:
+                    last_edit = now
+                    await progress.edit(embed=playlist_progress_embed(added, fillers.pending, done=False))
+        except Exception:
+            fillers.cancel()
+            await release_voice(session, connect_task)
+            return await progress.edit(embed=discord.Embed(
+                title="Error",
+                description=f"Error reading playlist after {added} tracks.",
+                color=discord.Color.red()
+            ))
+        if sessions.get(session.guild_id) is not session:
+            # Stopped while the playlist was still being read.
+            fillers.cancel()
+            return await progress.edit(embed=discord.Embed(
+                title="Playlist Stopped", description=f"Stopped after {added} tracks.", color=discord.Color.orange()
+            ))
+        if session.current is None and not session.queue:
+            # Nothing in the playlist could be played.
+            await release_voice(session, connect_task)
+        await progress.edit(embed=playlist_progress_embed(added, fillers.pending, done=False))
+        await fillers.join()
+        await progress.edit(embed=playlist_progress_embed(added, 0, done=True))
+
+    def playlist_progress_embed(added, pending, done):
+        if done:
+            return discord.Embed(
+                title="Playlist Queued", description=f"Added {added} tracks.", color=discord.Color.blue()
+            )
+        description = f"Added {added} tracks so far..."
+        if pending:
+            description += f"\nLooking up details for {pending} tracks."
+        return discord.Embed(title="Queueing Playlist", description=description, color=discord.Color.blue())
+
+    def library_embed(title, rows, empty):
+        if not rows:
+            return discord.Embed(title=title, description=empty, color=discord.Color.red())
+        lines = [
+            f"{i}. [{song_title}]({youtube_watch_url + video_id}) · {plays} play{'s' if plays != 1 else ''}"
+            for i, (video_id, song_title, plays, _) in enumerate(rows, start=1)
+        ]
+        return discord.Embed(title=title, description="\n".join(lines)[:4096], color=discord.Color.blue())
+
+    @client.command(name="history")
+    @commands.has_role(ROLE_NAME)
+    async def history(ctx):
+        await ctx.send(embed=library_embed(
+            "Recently Played", library.history(ctx.guild.id), "Nothing has been played here yet."
+        ))
+
+    @client.command(name="top")
+    @commands.has_role(ROLE_NAME)
+    async def top(ctx):
+        await ctx.send(embed=library_embed(
+            "Most Played", library.top(ctx.guild.id), "Nothing has been played here yet."
+        ))
+
+    @client.command(name="cache")
+    @commands.has_role(ROLE_NAME)
+    async def cache_cmd(ctx):
+        stats = metadata.stats
+        embed = discord.Embed(title="Metadata Cache", color=discord.Color.blue())
+        embed.add_field(name="Memory hits", value=str(stats["hits"]), inline=True)
+        embed.add_field(name="Disk hits", value=str(stats["disk_hits"]), inline=True)
+        embed.add_field(name="Misses", value=str(stats["misses"]), inline=True)
+        embed.add_field(name="Hit rate", value=f"{metadata.hit_rate():.1%}", inline=True)
+        embed.add_field(name="Tracks in memory", value=str(len(metadata.tracks)), inline=True)
+        embed.add_field(name="Queries in memory", value=str(len(metadata.queries)), inline=True)
+        if loudness:
+            embed.add_field(
+                name="Loudness",
+                value=f"{loudness.stats['analyzed']} analysed · {loudness.stats['failed']} failed · "
+                      f"{loudness.stats['dropped']} skipped while busy",
+                inline=False
+            )
+        embed.add_field(
+            name="Track library",
+            value=f"{len(library)} tracks · {library.stats['local']} queries answered locally, "
+                  f"{library.stats['remote']} sent to YouTube",
+            inline=False
+        )
+        embed.add_field(
+            name="Stream URLs",
+            value=f"{leases.stats['reused']} reused · {leases.stats['resolved']} resolved\n"
+                  f"{leases.stats['refreshed']} refreshed early · {leases.stats['invalidated']} failed in playback",
+            inline=False
+        )
+        if audio_cache:
+            embed.add_field(
+                name="Audio cache",
+                value=f"{len(audio_cache)} tracks · {audio_cache.size / 2**20:.0f}/{audio_cache.max_bytes / 2**20:.0f} MiB\n"
+                      f"Hit rate {audio_cache.hit_rate():.1%} · {audio_cache.stats['evicted']} evicted",
+                inline=False
+            )
+        await ctx.send(embed=embed)
+
+    @client.command(name="memory")
+    @commands.has_role(ROLE_NAME)
+    async def memory(ctx):
+        report = sessions.memory_report()
+        embed = discord.Embed(title="Memory Report", color=discord.Color.blue())
+        embed.add_field(name="Active sessions", value=str(report["sessions"]), inline=True)
+        embed.add_field(name="Queued songs", value=str(report["queued_tracks"]), inline=True)
+        embed.add_field(name="Session state", value=f"{report['session_bytes'] / 1024:.1f} KiB", inline=True)
+        embed.add_field(name="Largest session", value=f"{report['largest_session_bytes'] / 1024:.1f} KiB", inline=True)
+        embed.add_field(name="Created / evicted", value=f"{report['created']} / {report['evicted']}", inline=True)
+        if "peak_rss_bytes" in report:
+            embed.add_field(name="Peak RSS", value=f"{report['peak_rss_bytes'] / 2**20:.1f} MiB", inline=True)
+        await ctx.send(embed=embed)
+
+    def latency_lines(name):
+        return "\n".join(
+            f"`{label}` p50 {hist.quantile(0.5) * 1000:.0f}ms · p95 {hist.quantile(0.95) * 1000:.0f}ms · n={hist.count}"
+            for label, hist in sorted(metrics.family(name).items())
+        ) or "No data yet."
+
+    @client.command(name="stats")
+    @commands.has_permissions(administrator=True)
+    async def stats(ctx):
+        np_report = now_playing.report()
+        embed = discord.Embed(title="Bot Statistics", color=discord.Color.blue())
+        embed.add_field(name="Stages", value=latency_lines("stage_seconds")[:1024], inline=False)
+        embed.add_field(name="Commands", value=latency_lines("command_seconds")[:1024], inline=False)
+        embed.add_field(name="Time to first audio", value=latency_lines("time_to_first_audio_seconds")[:1024], inline=False)
+        embed.add_field(
+            name="FFmpeg CPU per stream",
+            value="\n".join(
+                f"`{mode}` p50 {hist.quantile(0.5):.2f}s · p95 {hist.quantile(0.95):.2f}s CPU per minute · n={hist.count}"
+                for mode, hist in sorted(metrics.family("ffmpeg_cpu_seconds_per_minute").items())
+            ) or "No data yet.",
+            inline=False
+        )
+        embed.add_field(
+            name="Startup",
+            value=startup_report(),
+            inline=False
+        )
+        lag = metrics.family("loop_lag_seconds").get("event_loop")
+        if lag is not None:
+            worst = max(watchdog.stalls, key=lambda stall: stall.duration, default=None)
+            embed.add_field(
+                name="Event loop lag",
+                value=f"p50 {lag.quantile(0.5) * 1000:.0f}ms · p99 {lag.quantile(0.99) * 1000:.0f}ms · "
+                      f"{len(watchdog.stalls)} stalls over {watchdog.threshold * 1000:.0f}ms"
+                      + (f"\nWorst: {worst.duration * 1000:.0f}ms in `{worst.task}`" if worst else ""),
+                inline=False
+            )
+        gauges = metrics.read_gauges()
+        embed.add_field(
+            name="Gauges",
+            value="\n".join(f"`{name}` {value}" for name, value in sorted(gauges.items())) or "No data yet.",
+            inline=False
+        )
+        embed.add_field(
+            name="Now Playing REST calls",
+            value=f"{np_report['calls']} calls for {np_report['updates']} updates\n"
+                  f"Saved {np_report['saved']} ({np_report['saved_per_update']:.1f} per update)\n"
+                  f"Throttled {np_report['throttled_seconds']:.1f}s",
+            inline=False
         )
-        for entry in data.get("entries", []):
-            await play(ctx, link=youtube_watch_url + entry["id"])
+        await ctx.send(embed=embed)
 
     @client.command(name="voicecheck")
     async def voicecheck(ctx):
@@ -527,21 +1180,36 @@ def run_bot():
         embed.add_field(name="▶️ !play <url|search> / !p", value="Play a song or resume queue", inline=False)
         embed.add_field(name="🔍 !search <keywords>",        value="Search YouTube and select a result", inline=False)
         embed.add_field(name="🔀 !shuffle",                  value="Randomize the queue order", inline=False)
-        embed.add_field(name="🗒️ !queue / !q",               value="Show the queue", inline=False)
+        embed.add_field(name="🗒️ !queue [page] / !q",        value="Show the queue", inline=False)
         embed.add_field(name="❌ !clear",                     value="Clear the queue", inline=False)
         embed.add_field(name="🗑️ !remove <position>",        value="Remove a song by position", inline=False)
+        embed.add_field(name="↕️ !move <from> <to>",         value="Move a song to another position", inline=False)
         embed.add_field(name="⏸️ !pause",                    value="Pause playback", inline=False)
         embed.add_field(name="▶️ !resume",                   value="Resume playback", inline=False)
         embed.add_field(name="⏭️ !skip / !s",                value="Skip the current song", inline=False)
         embed.add_field(name="⏹️ !stop / !fuckoff",          value="Stop and disconnect", inline=False)
         embed.add_field(name="🔁 !loop",                     value="Toggle loop for current song", inline=False)
         embed.add_field(name="🎶 !np",                       value="Show now playing and controls", inline=False)
-        embed.add_field(name="📝 !lyrics",                   value="Fetch lyrics for current song", inline=False)
+        embed.add_field(name="📝 !lyrics [page]",            value="Fetch lyrics for current song", inline=False)
         embed.add_field(name="📜 !playlist",                 value="Queue a YouTube playlist", inline=False)
+        embed.add_field(name="🕘 !history",                  value="Show recently played songs", inline=False)
+        embed.add_field(name="🏆 !top",                      value="Show this server's most played songs", inline=False)
+        embed.add_field(name="💾 !cache",                    value="Show metadata cache statistics", inline=False)
+        embed.add_field(name="🧠 !memory",                   value="Show per-guild session memory usage", inline=False)
+        embed.add_field(name="📊 !stats",                    value="Show bot performance statistics", inline=False)
         embed.add_field(name="🔊 !voicecheck",               value="Check voice channel status", inline=False)
         await ctx.send(embed=embed)
 
-    client.run(DISCORD_TOKEN)
+    mark_startup("build")
+    client.sessions = sessions
+    client.metrics  = metrics
+    client.watchdog = watchdog
+    return client
+
+def run_bot():
+    load_dotenv()
+    client = build_bot()
+    client.run(os.getenv("DISCORD_TOKEN"))
 
 if __name__ == "__main__":
     run_bot()
@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import discord
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+class Metrics:
+    def __init__(self):
+        self.histograms = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, label: str, value: float):
+        # Called from voice player threads as well as the loop.
+        with self._lock:
+            hist = self.histograms.get((name, label))
+            if hist is None:
+                hist = self.histograms[(name, label)] = Histogram()
+            hist.observe(value)
+
+    def gauge(self, name: str, fn):
+        self.gauges[name] = fn
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", stage, time.perf_counter() - start)
+
+    def family(self, name: str) -> dict:
+        with self._lock:
+            return {label: hist for (n, label), hist in self.histograms.items() if n == name}
+
+    def read_gauges(self) -> dict:
+        values = {}
+        for name, fn in self.gauges.items():
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if value is not None:
+                values[name] = value
+        return values
+
+    def render(self) -> str:
+        lines = []
+        label_names = {
+            "stage_seconds": "stage",
+            "command_seconds": "command",
+            "time_to_first_audio_seconds": "trigger",
+            "discord_rest_seconds": "route",
+            "ffmpeg_cpu_seconds_per_minute": "mode",
+            "startup_seconds": "phase",
+        }
+        with self._lock:
+            items = sorted(self.histograms.items())
+        family = None
+        for (name, label), hist in items:
+            key = label_names.get(name, "label")
+            metric = f"musicbot_{name}"
+            if name != family:
+                family = name
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip(BUCKETS + (float("inf"),), hist.counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{metric}_bucket{{{key}="{label}",le="{le}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{{key}="{label}"}} {hist.sum}')
+            lines.append(f'{metric}_count{{{key}="{label}"}} {hist.count}')
+        for name, value in sorted(self.read_gauges().items()):
+            lines.append(f"# TYPE musicbot_{name} gauge")
+            lines.append(f"musicbot_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host: str, port: int):
+        from aiohttp import web
+
+        async def handle(request):
+            return web.Response(text=self.render(), content_type="text/plain")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+class FirstPacketProbe(discord.AudioSource):
+    def __init__(self, source, on_first_packet):
+        self.source = source
+        self._on_first_packet = on_first_packet
+
+    def read(self) -> bytes:
+        data = self.source.read()
+        if self._on_first_packet is not None:
+            callback, self._on_first_packet = self._on_first_packet, None
+            callback()
+        return data
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.source.cleanup()
+
+
+class StreamCpuProbe(discord.AudioSource):
+    # Reports the FFmpeg process's CPU time per minute of audio when the stream ends.
+    # Every playback FFmpeg is wrapped in one, so the sources not yet cleaned up are
+    # also the bot's live playback processes.
+    active = set()
+
+    def __init__(self, source, on_report, min_seconds: float = 5.0):
+        self.source = source
+        self._on_report = on_report
+        self._min_seconds = min_seconds
+        self._started = None
+        StreamCpuProbe.active.add(self)
+
+    def read(self) -> bytes:
+        if self._started is None:
+            self._started = time.monotonic()
+        return self.source.read()
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self):
+        process = getattr(self.source, "_process", None)
+        pid = getattr(process, "pid", None)
+        cpu = process_cpu_seconds(pid) if pid else None
+        self.source.cleanup()
+        StreamCpuProbe.active.discard(self)
+        if cpu is None or self._started is None:
+            return
+        elapsed = time.monotonic() - self._started
+        if elapsed >= self._min_seconds:
+            self._on_report(cpu / elapsed * 60)
+
+
+def process_cpu_seconds(pid: int):
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read().decode(errors="replace")
+    except OSError:
+        return None
+    fields = stat[stat.rindex(")") + 2:].split()
+    # utime and stime are fields 14 and 15 of /proc/<pid>/stat, in clock ticks.
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def executor_queue_depth(loop):
+    executor = getattr(loop, "_default_executor", None)
+    queue = getattr(executor, "_work_queue", None)
+    return queue.qsize() if queue is not None else 0
+
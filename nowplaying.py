@@ -0,0 +1,142 @@
+import asyncio
+import time
+from collections import Counter
+
+import discord
+
+CONTROLS = ("⏸️", "▶️", "➡️")
+
+# Per-channel limits Discord applies to the routes the Now Playing message uses.
+ROUTE_LIMITS = {
+    "send": (5, 5.0),
+    "edit": (5, 5.0),
+    "react": (1, 0.25),
+}
+
+# fetch old message + delete it + send a new one + one add_reaction per control
+BASELINE_CALLS = 3 + len(CONTROLS)
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: int, per: float):
+        self.capacity = capacity
+        self.rate = capacity / per
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def delay(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        wait = (1 - self.tokens) / self.rate
+        self.tokens -= 1
+        return wait
+
+
+class RouteScheduler:
+    def __init__(self, limits: dict = ROUTE_LIMITS, metrics=None):
+        self.limits = limits
+        self.metrics = metrics
+        self.calls = Counter()
+        self.waited = 0.0
+        self._buckets = {}
+
+    async def call(self, route: str, major: int, factory):
+        bucket = self._buckets.get((route, major))
+        if bucket is None:
+            bucket = self._buckets[(route, major)] = TokenBucket(*self.limits[route])
+        wait = bucket.delay()
+        if wait:
+            self.waited += wait
+            await asyncio.sleep(wait)
+        self.calls[route] += 1
+        if self.metrics is None:
+            return await factory()
+        start = time.perf_counter()
+        try:
+            return await factory()
+        finally:
+            self.metrics.observe("discord_rest_seconds", route, time.perf_counter() - start)
+
+    def forget(self, major: int):
+        for route in self.limits:
+            self._buckets.pop((route, major), None)
+
+
+class NowPlayingController:
+    def __init__(self, render, coalesce_delay: float = 0.5, metrics=None, reactions=None, on_control=None):
+        self.render = render
+        self.reactions = reactions
+        self.on_control = on_control
+        self.coalesce_delay = coalesce_delay
+        self.scheduler = RouteScheduler(metrics=metrics)
+        self.updates = 0
+        self._pending = {}
+
+    def update(self, session):
+        # Track changes in quick succession (skips, loops) collapse into a single edit.
+        if session.guild_id in self._pending:
+            return
+        self._pending[session.guild_id] = asyncio.ensure_future(self._deferred(session))
+
+    async def _deferred(self, session):
+        try:
+            await asyncio.sleep(self.coalesce_delay)
+        finally:
+            if self._pending.get(session.guild_id) is asyncio.current_task():
+                del self._pending[session.guild_id]
+        await self.show(session)
+
+    async def show(self, session, **render_opts):
+        pending = self._pending.pop(session.guild_id, None)
+        if pending is not None:
+            pending.cancel()
+        if session.current is None or session.channel is None:
+            return
+        self.updates += 1
+        embed = self.render(session, **render_opts)
+        channel = session.channel
+        if session.np_message_id:
+            message = channel.get_partial_message(session.np_message_id)
+            try:
+                await self.scheduler.call("edit", channel.id, lambda: message.edit(embed=embed))
+                return
+            except discord.NotFound:
+                self._unbind(session)
+            except discord.Forbidden:
+                return
+        message = await self.scheduler.call("send", channel.id, lambda: channel.send(embed=embed))
+        session.np_message_id = message.id
+        if self.reactions is not None:
+            self.reactions.register(message.id, lambda payload: self.on_control(session, payload))
+        for emoji in CONTROLS:
+            await self.scheduler.call("react", channel.id, lambda emoji=emoji: message.add_reaction(emoji))
+
+    def _unbind(self, session):
+        if self.reactions is not None and session.np_message_id:
+            self.reactions.unregister(session.np_message_id)
+        session.np_message_id = None
+
+    def forget(self, session):
+        pending = self._pending.pop(session.guild_id, None)
+        if pending is not None:
+            pending.cancel()
+        self._unbind(session)
+        if session.channel is not None:
+            self.scheduler.forget(session.channel.id)
+
+    def report(self) -> dict:
+        calls = sum(self.scheduler.calls.values())
+        saved = BASELINE_CALLS * self.updates - calls
+        return {
+            "updates": self.updates,
+            "calls": calls,
+            "saved": saved,
+            "saved_per_update": saved / self.updates if self.updates else 0.0,
+            "throttled_seconds": self.scheduler.waited,
+        }
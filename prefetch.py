@@ -0,0 +1,76 @@
+import asyncio
+
+from extractor import INTERACTIVE, PREFETCH
+
+
+class _Prefetch:
+    __slots__ = ("song", "task", "stream_url", "source")
+
+    def __init__(self, song):
+        self.song = song
+        self.task = None
+        self.stream_url = None
+        self.source = None
+
+
+class Prefetcher:
+    def __init__(self, resolve_stream, make_source=None):
+        self.resolve_stream = resolve_stream
+        self.make_source = make_source
+        self._pending = {}
+
+    def schedule(self, guild_id, song, warm_in: float = None):
+        entry = self._pending.get(guild_id)
+        if entry and entry.song is song:
+            return
+        self.cancel(guild_id)
+        entry = _Prefetch(song)
+        entry.task = asyncio.ensure_future(self._run(entry, guild_id, warm_in))
+        self._pending[guild_id] = entry
+
+    async def _run(self, entry, guild_id, warm_in):
+        entry.stream_url = await self.resolve_stream(entry.song.url, guild_id, PREFETCH)
+        if self.make_source is None or warm_in is None:
+            return
+        # Spawn FFmpeg shortly before the handoff so the stream isn't held open for a whole track.
+        await asyncio.sleep(warm_in)
+        entry.source = self.make_source(entry.stream_url, entry.song)
+
+    async def take(self, guild_id, song):
+        entry = self._pending.get(guild_id)
+        if entry is None or entry.song is not song:
+            return None, None
+        del self._pending[guild_id]
+        task = entry.task
+        if task.done():
+            if task.cancelled() or task.exception() is not None:
+                return None, None
+            return entry.stream_url, entry.source
+        if entry.stream_url is not None:
+            # Resolved but not warmed yet: skip the warm-up wait and hand over the URL.
+            task.cancel()
+            return entry.stream_url, None
+        try:
+            # Still extracting: rejoin the same lookup at interactive priority so it jumps the queue.
+            return await self.resolve_stream(song.url, guild_id, INTERACTIVE), None
+        except Exception:
+            return None, None
+        finally:
+            task.cancel()
+
+    def song_for(self, guild_id):
+        entry = self._pending.get(guild_id)
+        return entry.song if entry else None
+
+    def discard(self, guild_id, song):
+        entry = self._pending.get(guild_id)
+        if entry is not None and entry.song is song:
+            self.cancel(guild_id)
+
+    def cancel(self, guild_id):
+        entry = self._pending.pop(guild_id, None)
+        if entry is None:
+            return
+        entry.task.cancel()
+        if entry.source is not None:
+            entry.source.cleanup()
@@ -0,0 +1,34 @@
+import asyncio
+
+
+class ReactionRouter:
+    # Reactions are matched to handlers by message id, so the bot doesn't need the message
+    # itself in its cache and unrelated reactions cost one dict lookup.
+    def __init__(self):
+        self._handlers = {}
+
+    def __len__(self):
+        return len(self._handlers)
+
+    def register(self, message_id: int, handler):
+        self._handlers[message_id] = handler
+
+    def unregister(self, message_id: int, handler=None):
+        if handler is None or self._handlers.get(message_id) is handler:
+            self._handlers.pop(message_id, None)
+
+    def expect(self, message_id: int, check) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+
+        async def handler(payload):
+            if not fut.done() and check(payload):
+                fut.set_result(payload)
+
+        self.register(message_id, handler)
+        fut.add_done_callback(lambda _: self.unregister(message_id, handler))
+        return fut
+
+    async def dispatch(self, payload):
+        handler = self._handlers.get(payload.message_id)
+        if handler is not None:
+            await handler(payload)
@@ -0,0 +1,120 @@
+import asyncio
+import re
+import urllib.parse
+
+import aiohttp
+
+YOUTUBE_RESULTS_URL = "https://www.youtube.com/results?"
+VIDEO_ID_RE = re.compile(r"/watch\?v=([\w-]{11})")
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def extract_video_id(url: str):
+    parsed = urllib.parse.urlparse(url)
+    if parsed.hostname and parsed.hostname.endswith("youtu.be"):
+        return parsed.path.lstrip("/")[:11] or None
+    ids = urllib.parse.parse_qs(parsed.query).get("v")
+    return ids[0] if ids else None
+
+
+def is_opus_stream(url: str) -> bool:
+    # Audio-only WebM streams from googlevideo are always Opus.
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+    return query.get("mime", [""])[0] == "audio/webm"
+
+
+class SearchResolver:
+    def __init__(self, extract, cache=None, timeout: float = 5.0):
+        self.extract = extract
+        self.cache = cache
+        self.timeout = aiohttp.ClientTimeout(total=timeout, sock_connect=timeout / 2)
+        self._session = None
+        self._inflight = {}
+
+    def attach(self, connector: aiohttp.BaseConnector):
+        # Share discord.py's pooled keep-alive connector instead of opening our own.
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            connector_owner=False,
+            timeout=self.timeout,
+            cookie_jar=aiohttp.DummyCookieJar(),
+        )
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        return self._session
+
+    async def _coalesce(self, key, factory):
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(factory())
+            self._inflight[key] = fut
+
+            def _forget(done):
+                if self._inflight.get(key) is done:
+                    del self._inflight[key]
+
+            fut.add_done_callback(_forget)
+        # A caller giving up must not cancel the lookup for everyone else waiting on it.
+        return await asyncio.shield(fut)
+
+    async def resolve(self, query: str):
+        norm = normalize_query(query)
+        if self.cache:
+            video_id = self.cache.get_query(norm)
+            if video_id:
+                return video_id
+        video_id = await self._coalesce(("resolve", norm), lambda: self._scrape(query))
+        if video_id and self.cache:
+            self.cache.put_query(norm, video_id)
+        return video_id
+
+    async def _scrape(self, query: str):
+        url = YOUTUBE_RESULTS_URL + urllib.parse.urlencode({"search_query": query})
+        try:
+            async with self._get_session().get(url) as resp:
+                resp.raise_for_status()
+                html = await resp.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+        m = VIDEO_ID_RE.search(html)
+        return m.group(1) if m else None
+
+    async def search(self, keywords: str, limit: int = 5, guild_id=None):
+        norm = normalize_query(keywords)
+        cache_key = f"ytsearch{limit}:{norm}"
+        if self.cache:
+            cached = self._cached_search(cache_key)
+            if cached:
+                return cached
+        entries = await self._coalesce(("search", limit, norm), lambda: self._search(keywords, limit, guild_id))
+        if entries and self.cache:
+            ids = [e["id"] for e in entries if e.get("id")]
+            for e in entries:
+                self.cache.put_track(e.get("id"), e)
+            self.cache.put_query(cache_key, ",".join(ids))
+        return entries
+
+    def _cached_search(self, cache_key: str):
+        value = self.cache.get_query(cache_key)
+        if not value:
+            return None
+        entries = []
+        for video_id in value.split(","):
+            info = self.cache.get_track(video_id)
+            if info is None:
+                return None
+            entries.append(dict(info, id=video_id))
+        return entries
+
+    async def _search(self, keywords: str, limit: int, guild_id=None):
+        data = await self.extract(f"ytsearch{limit}:{keywords}", guild_id=guild_id)
+        return data.get("entries", []) if data else []
@@ -0,0 +1,132 @@
+import asyncio
+import sys
+import time
+
+from tracks import Track, TrackQueue
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class GuildSession:
+    __slots__ = (
+        "guild_id", "channel", "queue", "voice_client", "current", "started_at",
+        "loop", "np_message_id", "last_active",
+    )
+
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.channel = None
+        self.queue = TrackQueue()
+        self.voice_client = None
+        self.current = None
+        self.started_at = None
+        self.loop = False
+        self.np_message_id = None
+        self.last_active = time.monotonic()
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def is_connected(self) -> bool:
+        return self.voice_client is not None and self.voice_client.is_connected()
+
+    def is_playing(self) -> bool:
+        return self.is_connected() and self.voice_client.is_playing()
+
+    def is_dormant(self, idle_timeout: float) -> bool:
+        if self.is_playing() or (self.is_connected() and self.voice_client.is_paused()):
+            return False
+        return time.monotonic() - self.last_active > idle_timeout
+
+
+def track_size(track: Track) -> int:
+    return sys.getsizeof(track) + sum(
+        sys.getsizeof(getattr(track, name)) for name in Track.__slots__
+    )
+
+
+def session_size(session: GuildSession) -> int:
+    size = sys.getsizeof(session) + sys.getsizeof(session.queue) + sys.getsizeof(session.queue._items)
+    for track in session.queue:
+        size += track_size(track)
+    if session.current is not None:
+        size += track_size(session.current)
+    return size
+
+
+class SessionManager:
+    def __init__(self, idle_timeout: float = 900.0):
+        self.idle_timeout = idle_timeout
+        self.on_teardown = []
+        self.created = 0
+        self.evicted = 0
+        self._sessions = {}
+        self._reaper = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __iter__(self):
+        return iter(list(self._sessions.values()))
+
+    def get(self, guild_id: int):
+        return self._sessions.get(guild_id)
+
+    def get_or_create(self, guild_id: int) -> GuildSession:
+        session = self._sessions.get(guild_id)
+        if session is None:
+            session = self._sessions[guild_id] = GuildSession(guild_id)
+            self.created += 1
+        session.touch()
+        return session
+
+    def teardown(self, guild_id: int):
+        session = self._sessions.pop(guild_id, None)
+        if session is None:
+            return None
+        for hook in self.on_teardown:
+            hook(session)
+        if session.voice_client is not None:
+            session.voice_client.stop()
+        session.queue.clear()
+        session.voice_client = None
+        session.current = None
+        return session
+
+    def start_reaper(self, interval: float = 60.0):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.ensure_future(self._reap_forever(interval))
+
+    async def _reap_forever(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.reap()
+
+    async def reap(self) -> int:
+        dormant = [s for s in self._sessions.values() if s.is_dormant(self.idle_timeout)]
+        for session in dormant:
+            vc = session.voice_client
+            self.teardown(session.guild_id)
+            if vc is not None and vc.is_connected():
+                await vc.disconnect()
+        self.evicted += len(dormant)
+        return len(dormant)
+
+    def memory_report(self) -> dict:
+        sizes = [session_size(s) for s in self._sessions.values()]
+        report = {
+            "sessions": len(sizes),
+            "queued_tracks": sum(len(s.queue) for s in self._sessions.values()),
+            "session_bytes": sum(sizes),
+            "largest_session_bytes": max(sizes, default=0),
+            "created": self.created,
+            "evicted": self.evicted,
+        }
+        if resource is not None:
+            # ru_maxrss is KiB on Linux, bytes on macOS.
+            scale = 1 if sys.platform == "darwin" else 1024
+            report["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        return report
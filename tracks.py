@@ -0,0 +1,73 @@
+import random
+from collections import deque
+from itertools import islice
+
+
+class Track:
+    __slots__ = ("title", "url", "duration", "thumbnail", "user")
+
+    def __init__(self, title: str, url: str, duration: int = 0, thumbnail: str = None, user: str = None):
+        self.title = title
+        self.url = url
+        self.duration = duration
+        self.thumbnail = thumbnail
+        self.user = user
+
+    def __repr__(self):
+        return f"Track({self.title!r}, {self.url!r})"
+
+
+class TrackQueue:
+    __slots__ = ("_items",)
+
+    def __init__(self, tracks=()):
+        self._items = deque(tracks)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __bool__(self):
+        return bool(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __getitem__(self, index: int) -> Track:
+        return self._items[index]
+
+    def append(self, track: Track):
+        self._items.append(track)
+
+    def extend(self, tracks):
+        self._items.extend(tracks)
+
+    def popleft(self) -> Track:
+        return self._items.popleft()
+
+    def remove_at(self, index: int) -> Track:
+        # deque deletion rotates from whichever end is closer, so this is O(min(i, n - i)).
+        track = self._items[index]
+        del self._items[index]
+        return track
+
+    def move(self, src: int, dst: int) -> Track:
+        track = self.remove_at(src)
+        self._items.insert(dst, track)
+        return track
+
+    def shuffle(self, seed: int = None):
+        # Indexing into the middle of a deque is O(n), so shuffle a flat copy and swap it back in.
+        items = list(self._items)
+        random.Random(seed).shuffle(items)
+        self._items.clear()
+        self._items.extend(items)
+
+    def clear(self):
+        self._items.clear()
+
+    def page(self, number: int, per_page: int = 10):
+        start = (number - 1) * per_page
+        return list(enumerate(islice(self._items, start, start + per_page), start=start + 1))
+
+    def page_count(self, per_page: int = 10) -> int:
+        return max(1, -(-len(self._items) // per_page))
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+log = logging.getLogger("musicbot.watchdog")
+
+
+class Stall:
+    __slots__ = ("at", "task", "stack", "duration")
+
+    def __init__(self, at, task, stack):
+        self.at = at
+        self.task = task
+        self.stack = stack
+        self.duration = None
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float = 0.25, interval: float = 0.05, metrics=None,
+                 strict: bool = False, keep: int = 20):
+        self.threshold = threshold
+        self.interval = interval
+        self.metrics = metrics
+        self.strict = strict
+        self.stalls = deque(maxlen=keep)
+        self.violations = []
+        self._beat = None
+        self._captured = None
+        self._loop = None
+        self._thread_id = None
+        self._stop = threading.Event()
+
+    def start(self, loop=None):
+        # Must be called from the loop's own thread.
+        self._loop = loop or asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._loop.create_task(self._heartbeat())
+        threading.Thread(target=self._sample, name="loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    async def _heartbeat(self):
+        while not self._stop.is_set():
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = now - before - self.interval
+            self._beat = now
+            if self.metrics is not None:
+                self.metrics.observe("loop_lag_seconds", "event_loop", max(lag, 0.0))
+            stall = self._captured
+            if stall is not None:
+                self._captured = None
+                stall.duration = lag
+                self._report(stall)
+
+    def _sample(self):
+        while not self._stop.wait(self.threshold / 4):
+            beat = self._beat
+            if self._captured is not None or time.monotonic() - beat < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            task = self._current_task()
+            # Only keep the capture if the loop is still stuck on the same beat.
+            if self._beat == beat:
+                self._captured = Stall(time.time(), task, stack)
+
+    def _current_task(self):
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            return None
+        if task is None:
+            return None
+        coro = task.get_coro()
+        return getattr(coro, "__qualname__", None) or repr(coro)
+
+    def _report(self, stall: Stall):
+        self.stalls.append(stall)
+        where = stall.task or "a callback outside any task"
+        if self.strict:
+            self.violations.append(stall)
+        log.log(logging.ERROR if self.strict else logging.WARNING,
+                "event loop blocked for %.0f ms in %s\n%s", stall.duration * 1e3, where, stall.stack)